@@ -0,0 +1,129 @@
+"""
+Run data-parallel training on the CPU with the gloo backend and compare the
+monitoring I/O of N ranks against a single process.
+
+Each rank trains a DistributedDataParallel MLP on its own shard of the data
+with monitor_module(distributed=True). Only rank 0 writes, so the event
+bytes should stay close to those of a single process, and every merged
+histogram of a monitored var should count the elements of all ranks.
+
+    python benchmarks/bench_distributed.py --world-sizes 1 2 4 --out dist.json
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class MLP(torch.nn.Module):
+    def __init__(self, width, depth):
+        super(MLP, self).__init__()
+        self.layers = torch.nn.ModuleList([torch.nn.Linear(width, width) for _ in range(depth)])
+
+    def forward(self, x):
+        for i, layer in enumerate(self.layers):
+            x = torch.relu(layer(x))
+            self.monitor('h{}'.format(i), x)
+        return x
+
+class CountingWriter(object):
+    """ Records what reaches rank 0's writer so merged counts can be checked """
+    def __init__(self, writer):
+        self.writer = writer
+        self.nums = dict()
+
+    def add_histogram_raw(self, tag, global_step=None, **kwargs):
+        self.nums[tag] = kwargs['num']
+        self.writer.add_histogram_raw(tag, global_step=global_step, **kwargs)
+
+    def __getattr__(self, name):
+        if name == 'writer':
+            raise AttributeError(name)
+        return getattr(self.writer, name)
+
+def run_rank(rank, world_size, port, args, log_dir, results):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.manual_seed(0)
+    torch.set_num_threads(1)
+    from tensorboardX import SummaryWriter
+    from pytorch_monitor import monitor_module
+
+    model = MLP(args.width, args.depth)
+    writer = CountingWriter(SummaryWriter(log_dir)) if rank == 0 else None
+    writer = monitor_module(model, writer, track_stats=True, distributed=True)
+    ddp = torch.nn.parallel.DistributedDataParallel(model)
+    optimizer = torch.optim.SGD(ddp.parameters(), lr=1e-3)
+    torch.manual_seed(rank)
+    x = torch.randn(args.batch_size, args.width)
+
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        optimizer.zero_grad()
+        ddp(x).sum().backward()
+        optimizer.step()
+    model.flush_monitoring()
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    if rank == 0:
+        results['step_ms'] = elapsed / args.steps * 1e3
+        results['reductions'] = writer.reductions
+        results['h0_num'] = writer.writer.nums.get('h0/data')
+    dist.destroy_process_group()
+
+def dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+def measure(world_size, args):
+    log_dir = tempfile.mkdtemp(prefix='bench-distributed-')
+    with mp.Manager() as manager:
+        results = manager.dict()
+        mp.spawn(run_rank, args=(world_size, free_port(), args, log_dir, results),
+                 nprocs=world_size, join=True)
+        result = dict(results)
+    result['world_size'] = world_size
+    result['event_bytes'] = dir_bytes(log_dir)
+    result['event_files'] = sum(len(files) for _, _, files in os.walk(log_dir))
+    result['expected_h0_num'] = world_size * args.batch_size * args.width
+    shutil.rmtree(log_dir, ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--world-sizes', nargs='+', type=int, default=[1, 2, 4])
+    parser.add_argument('--width', type=int, default=128)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--out', help='save the results to this JSON file')
+    args = parser.parse_args()
+
+    results = [measure(world_size, args) for world_size in args.world_sizes]
+    for r in results:
+        print('world size {:>2}: {:>8.1f} KB in {} event file(s), {:>3} all_reduces, '
+              '{:.2f} ms/step, h0 histogram counts {} of {} elements'.format(
+                  r['world_size'], r['event_bytes'] / 2**10, r['event_files'], r['reductions'],
+                  r['step_ms'], r['h0_num'], r['expected_h0_num']))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'args':vars(args), 'results':results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
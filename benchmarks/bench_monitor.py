@@ -0,0 +1,250 @@
+"""
+Measure what monitor_module costs per training step.
+
+Every configuration (model size x tracking options) runs in a fresh process
+so peak RSS is per configuration. Each one times forward + backward + SGD
+steps on the CPU and records latency percentiles, peak RSS, the most bytes
+of monitored vars kept alive between steps, the bytes written to the event
+files and the overhead relative to the unmonitored run of the same model
+size. Results are saved as JSON so that runs from
+different commits can be compared with --compare.
+
+    python benchmarks/bench_monitor.py --sizes tiny small --out bench.json
+    python benchmarks/bench_monitor.py --out new.json --compare bench.json
+    python benchmarks/bench_monitor.py --monitor-kwargs '{"eager_vars": true}'
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# name -> (width, depth); 'large' is ~100M parameters
+MODEL_SIZES = {
+    'tiny':(32, 2),
+    'small':(256, 4),
+    'medium':(1024, 8),
+    'large':(4096, 6),
+}
+TRACK_OPTIONS = ('track_data', 'track_grad', 'track_update', 'track_update_ratio', 'monitor_vars')
+
+def make_model(width, depth):
+    import torch
+
+    class MLP(torch.nn.Module):
+        def __init__(self):
+            super(MLP, self).__init__()
+            self.layers = torch.nn.ModuleList(
+                [torch.nn.Linear(width, width) for _ in range(depth)])
+            self.monitor_vars = False
+
+        def forward(self, x):
+            for i, layer in enumerate(self.layers):
+                x = torch.relu(layer(x))
+                if self.monitor_vars:
+                    self.monitor('h{}'.format(i), x)
+            return x
+
+    return MLP()
+
+def option_sets(mode):
+    """ The tracking configurations to run; None is the unmonitored baseline """
+    sets = [None]
+    if mode == 'all':
+        for values in itertools.product([False, True], repeat=len(TRACK_OPTIONS)):
+            options = dict(zip(TRACK_OPTIONS, values))
+            # the update ratio is only computed along with update tracking
+            if options['track_update_ratio'] and not options['track_update']:
+                continue
+            sets.append(options)
+    else:
+        off = {option:False for option in TRACK_OPTIONS}
+        for option in TRACK_OPTIONS:
+            options = dict(off, **{option:True})
+            if option == 'track_update_ratio':
+                options['track_update'] = True
+            sets.append(options)
+        sets.append({option:True for option in TRACK_OPTIONS})
+    return sets
+
+def config_name(options):
+    if options is None:
+        return 'off'
+    on = [option for option in TRACK_OPTIONS if options[option]]
+    return '+'.join(on) if on else 'hooks-only'
+
+def dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def held_var_bytes(model):
+    """ Bytes of storage that monitored_vars keeps alive; eager vars only hold weak references """
+    total = 0
+    for mod in model.modules():
+        for var in getattr(mod, 'monitored_vars', {}).values():
+            if not var.get('eager'):
+                total += var['tensor'].untyped_storage().nbytes()
+    return total
+
+def run_config(size, options, args, conn):
+    """ Benchmark one configuration; runs in its own process """
+    import torch
+    from tensorboardX import SummaryWriter
+    from pytorch_monitor import monitor_module
+
+    torch.manual_seed(0)
+    torch.set_num_threads(args.threads)
+    width, depth = MODEL_SIZES[size]
+    model = make_model(width, depth)
+    optimizer = torch.optim.SGD(model.parameters(), lr=1e-3)
+    x = torch.randn(args.batch_size, width)
+
+    log_dir = tempfile.mkdtemp(prefix='bench-monitor-')
+    writer = None
+    if options is not None:
+        writer = SummaryWriter(log_dir)
+        kwargs = {key:val for key, val in options.items() if key != 'monitor_vars'}
+        kwargs.update(args.monitor_kwargs)
+        writer = monitor_module(model, writer, **kwargs)
+        model.monitor_vars = options['monitor_vars']
+
+    times = []
+    held = 0
+    for i in range(args.warmup + args.steps):
+        start = time.perf_counter()
+        optimizer.zero_grad()
+        model(x).sum().backward()
+        optimizer.step()
+        if i >= args.warmup:
+            times.append(time.perf_counter() - start)
+        held = max(held, held_var_bytes(model))
+    if writer is not None:
+        model.flush_monitoring()
+        writer.close()
+
+    times = np.array(times) * 1e3
+    result = {
+        'size':size,
+        'params':sum(p.numel() for p in model.parameters()),
+        'config':config_name(options),
+        'options':options,
+        'steps':args.steps,
+        'p50_ms':float(np.percentile(times, 50)),
+        'p90_ms':float(np.percentile(times, 90)),
+        'p99_ms':float(np.percentile(times, 99)),
+        'mean_ms':float(times.mean()),
+        'peak_rss_bytes':peak_rss_bytes(),
+        'held_var_bytes':held,
+        'event_bytes':dir_bytes(log_dir),
+    }
+    shutil.rmtree(log_dir, ignore_errors=True)
+    conn.send(result)
+    conn.close()
+
+def run_isolated(size, options, args):
+    ctx = mp.get_context('spawn')
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=run_config, args=(size, options, args, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                             text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def add_overheads(results):
+    """ Overhead of each configuration relative to the unmonitored run of its size """
+    baselines = {r['size']:r for r in results if r['config'] == 'off'}
+    for r in results:
+        base = baselines.get(r['size'])
+        if base is not None:
+            r['overhead_p50'] = r['p50_ms'] / base['p50_ms'] - 1.
+            r['overhead_rss_bytes'] = r['peak_rss_bytes'] - base['peak_rss_bytes']
+
+def print_table(results, previous=None):
+    previous = {(r['size'], r['config']):r for r in (previous or [])}
+    width = max(len(r['config']) for r in results)
+    header = '{:<8} {:<{}} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10} {:>11}'.format(
+        'size', 'config', width, 'p50 ms', 'p99 ms', 'overhead', 'rss MB', 'vars MB', 'events KB',
+        'vs previous')
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        old = previous.get((r['size'], r['config']))
+        change = '{:+.1%}'.format(r['p50_ms'] / old['p50_ms'] - 1.) if old else ''
+        print('{:<8} {:<{}} {:>9.2f} {:>9.2f} {:>9.1%} {:>9.1f} {:>9.1f} {:>10.1f} {:>11}'.format(
+            r['size'], r['config'], width, r['p50_ms'], r['p99_ms'], r.get('overhead_p50', 0.),
+            r['peak_rss_bytes'] / 2**20, r.get('held_var_bytes', 0) / 2**20,
+            r['event_bytes'] / 2**10, change))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--sizes', nargs='+', default=['tiny', 'small', 'medium'],
+                        choices=sorted(MODEL_SIZES))
+    parser.add_argument('--configs', default='single', choices=['single', 'all'],
+                        help='each option on its own (plus all on), or every combination')
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--monitor-kwargs', type=json.loads, default={},
+                        help='extra monitor_module keyword arguments as JSON, '
+                             'e.g. \'{"track_stats": true, "schedule": 10}\'')
+    parser.add_argument('--out', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for options in option_sets(args.configs):
+            results.append(run_isolated(size, options, args))
+    add_overheads(results)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    print_table(results, previous)
+
+    if args.out:
+        import torch
+        report = {
+            'commit':git_commit(),
+            'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform':platform.platform(),
+            'python':platform.python_version(),
+            'torch':torch.__version__,
+            'args':vars(args),
+            'results':results,
+        }
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
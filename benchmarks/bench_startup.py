@@ -0,0 +1,95 @@
+"""
+Measure cold-start time: importing pytorch_monitor and running init_experiment
+until training could take its first step.
+
+Each measurement runs in a fresh interpreter inside a throwaway git repo.
+--git-delay adds a pre-commit hook that sleeps, to mimic a large repository
+or slow hooks; compare the synchronous git snapshot (background_git=False)
+with the default background one.
+
+    python benchmarks/bench_startup.py --git-delay 3 --out startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SCRIPT = '''
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, {package_dir!r})
+import pytorch_monitor
+imported = time.perf_counter()
+from pytorch_monitor import init_experiment
+writer, config = init_experiment({{'log_dir':'runs', 'background_git':{background}}})
+ready = time.perf_counter()
+from pytorch_monitor import wait_for_git_snapshots
+wait_for_git_snapshots()
+recorded = time.perf_counter()
+writer.close()
+print(json.dumps({{
+    'import_s':imported - start,
+    'first_step_s':ready - start,
+    'snapshot_recorded_s':recorded - start,
+    'commit_hash':config.get('commit_hash'),
+}}))
+'''
+
+def make_repo(git_delay):
+    repo = tempfile.mkdtemp(prefix='bench-startup-')
+    def git(*args):
+        subprocess.run(('git',) + args, cwd=repo, check=True, stdout=subprocess.DEVNULL)
+    git('init', '-q')
+    git('config', 'user.email', 'bench@example.com')
+    git('config', 'user.name', 'bench')
+    with open(os.path.join(repo, 'train.py'), 'w') as f:
+        f.write('# training script\n')
+    git('add', 'train.py')
+    git('commit', '-q', '-m', 'init')
+    if git_delay:
+        hook = os.path.join(repo, '.git', 'hooks', 'pre-commit')
+        with open(hook, 'w') as f:
+            f.write('#!/bin/sh\nsleep {}\n'.format(git_delay))
+        os.chmod(hook, 0o755)
+    return repo
+
+def measure(background, git_delay):
+    repo = make_repo(git_delay)
+    try:
+        script = SCRIPT.format(package_dir=os.path.abspath(PACKAGE_DIR), background=background)
+        out = subprocess.run([sys.executable, '-c', script], cwd=repo, check=True,
+                             stdout=subprocess.PIPE, universal_newlines=True).stdout
+        return json.loads(out.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(repo, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--git-delay', type=float, default=0.,
+                        help='seconds a pre-commit hook sleeps for')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--out', help='save the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    for background in (False, True):
+        for _ in range(args.repeats):
+            result = measure(background, args.git_delay)
+            result['background_git'] = background
+            results.append(result)
+            print('background_git={:<5}  import {:.3f}s  first step {:.3f}s  '
+                  'snapshot recorded {:.3f}s'.format(
+                      str(background), result['import_s'], result['first_step_s'],
+                      result['snapshot_recorded_s']))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'args':vars(args), 'results':results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,24 @@
-from pytorch_monitor.init_experiment import init_experiment
-from pytorch_monitor.monitor import monitor_module
+import importlib
+
+# init_experiment only needs the standard library, and binding it here keeps
+# the function from being shadowed by its submodule once that is imported.
+from pytorch_monitor.init_experiment import init_experiment, wait_for_git_snapshots
+
+# The other submodules are only imported when one of their names is first used,
+# so that importing the package doesn't pay for torch, tensorboardX or matplotlib.
+_lazy_names = {
+    'monitor_module':'pytorch_monitor.monitor',
+    'AsyncSummaryWriter':'pytorch_monitor.async_writer',
+    'DistributedSummaryWriter':'pytorch_monitor.distributed',
+    'ColumnarWriter':'pytorch_monitor.store',
+    'MetricsReader':'pytorch_monitor.store',
+}
+
+__all__ = ['init_experiment', 'wait_for_git_snapshots'] + list(_lazy_names)
+
+def __getattr__(name):
+    if name in _lazy_names:
+        value = getattr(importlib.import_module(_lazy_names[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,140 @@
+import queue
+import threading
+import warnings
+
+import torch
+
+from pytorch_monitor.histogram import add_summaries, summarize
+from pytorch_monitor.stats import add_scalar_records, moment_stats
+
+def _snapshot(value):
+    """ Copy tensors so later in-place updates can't change what gets logged """
+    if isinstance(value, torch.Tensor):
+        return value.detach().clone()
+    return value
+
+class AsyncSummaryWriter(object):
+    """
+    Wraps a SummaryWriter so that host transfers and event file writes happen
+    on a background thread instead of in the training step.
+
+    Histograms are summarized on device right away and only their bins-sized
+    rows are queued, so a queued record never holds a copy of a whole tensor.
+    Every other `add_*` call snapshots its tensor arguments and enqueues the
+    call on a bounded queue. When the queue is full, `policy='block'` waits
+    for the worker to catch up and `policy='drop'` discards the record and
+    counts it in `dropped`. Call `flush()` to wait for everything queued so
+    far and `close()` when done.
+    """
+    def __init__(self, writer, max_queue=1024, policy='block'):
+        if policy not in ('block', 'drop'):
+            raise ValueError("policy must be 'block' or 'drop', got {}".format(policy))
+        self.writer = writer
+        self.policy = policy
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.closed = False
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                fn, args, kwargs = item
+                fn(*args, **kwargs)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                warnings.warn('Async summary write failed: {!r}'.format(e))
+            finally:
+                self.queue.task_done()
+
+    def _enqueue(self, fn, *args, **kwargs):
+        if self.closed:
+            raise RuntimeError('Cannot write to a closed AsyncSummaryWriter')
+        item = (fn, args, kwargs)
+        if self.policy == 'block':
+            self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+    def add_histograms(self, records, bins):
+        """ Summarize a batch of (tag, tensor, global_step) histograms on device and enqueue the rows """
+        if not records:
+            return
+        tags, tensors, steps = zip(*records)
+        # fresh rows that nothing else writes to, so there is nothing to snapshot
+        self._enqueue(add_summaries, self.writer, list(zip(tags, summarize(tensors, bins), steps)))
+
+    def add_summaries(self, records):
+        """ Enqueue a batch of (tag, summary row, global_step) histograms """
+        if not records:
+            return
+        records = [(tag, _snapshot(row), step) for tag, row, step in records]
+        self._enqueue(add_summaries, self.writer, records)
+
+    def add_stat_records(self, moments):
+        """ Derive the stats of (tag, moments, global_step) records on device and enqueue them """
+        self.add_scalar_records(moment_stats(moments))
+
+    def add_scalar_records(self, scalars):
+        """ Enqueue a batch of (tag, 0-d tensor, global_step) scalars """
+        if not scalars:
+            return
+        scalars = [(tag, _snapshot(value), step) for tag, value, step in scalars]
+        self._enqueue(add_scalar_records, self.writer, scalars)
+
+    def __getattr__(self, name):
+        """ Forward add_* calls to the wrapped writer through the queue """
+        if name == 'writer':
+            raise AttributeError(name)
+        attr = getattr(self.writer, name)
+        if not (name.startswith('add_') and callable(attr)):
+            return attr
+        def enqueue(*args, **kwargs):
+            args = [_snapshot(arg) for arg in args]
+            kwargs = {key:_snapshot(val) for key, val in kwargs.items()}
+            self._enqueue(attr, *args, **kwargs)
+        return enqueue
+
+    @property
+    def queue_depth(self):
+        """ Number of records waiting to be written """
+        return self.queue.qsize()
+
+    def stats(self):
+        """ Counters for monitoring the monitor """
+        return {
+            'queue_depth':self.queue_depth,
+            'dropped':self.dropped,
+            'written':self.written,
+            'failed':self.failed,
+        }
+
+    def flush(self):
+        """ Block until everything enqueued so far is written to disk """
+        self.queue.join()
+        self.writer.flush()
+
+    def close(self):
+        """ Write out the queue, stop the worker and close the wrapped writer """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self._thread.join()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,156 @@
+import numpy as np
+import torch
+import torch.distributed as dist
+
+from pytorch_monitor.histogram import _flat, histogram_raw
+from pytorch_monitor.stats import add_scalar_records, moment_stats
+
+def is_writer_rank(group=None):
+    """ Whether this process writes summaries: rank 0, or any process outside torch.distributed """
+    return not (dist.is_available() and dist.is_initialized()) or dist.get_rank(group) == 0
+
+class DistributedSummaryWriter(object):
+    """
+    Merges histograms and scalars across the ranks of a torch.distributed
+    group and writes them from rank 0 only.
+
+    Histograms are binned on each rank's device over fixed edges shared by all
+    ranks, so the counts of all ranks simply add up. A histogram's range starts
+    as hist_range and, with adaptive=True, follows the global [min, max] of
+    its previous reduction, so it lags one logged step behind the data.
+    Values outside the range land in the edge buckets, whose written limits
+    reach out to the merged min and max; buckets are never written outside them.
+    Stats are merged from the moments of every rank's shard (see
+    stats.moment_records), so norms, means, stds and sparsities are those of
+    all ranks' values together. Other scalars are averaged over the ranks.
+    Everything logged during a step is
+    merged with a single all_reduce when reduce_pending() is called, which
+    monitor_module does at the start of every forward pass.
+
+    All ranks have to log the same tags and call reduce_pending(), flush() and
+    close() together. writer is only needed (and only used) on rank 0.
+    """
+    def __init__(self, writer=None, hist_range=(-1., 1.), adaptive=True, group=None):
+        self.writer = writer
+        self.group = group
+        self.rank = dist.get_rank(group)
+        self.world_size = dist.get_world_size(group)
+        if self.rank == 0 and writer is None:
+            raise ValueError('Rank 0 needs a writer to write the merged summaries with')
+        self.hist_range = hist_range
+        self.adaptive = adaptive
+        self.ranges = dict()
+        self.pending_histograms = [] # (tag, step, lo, hi, row)
+        self.pending_stats = [] # (tag, step, moments)
+        self.pending_scalars = [] # (tag, step, value)
+        self.reductions = 0
+
+    def _summarize(self, tensor, lo, hi, bins):
+        """
+        [num, sum, sum_squares, min of each rank, max of each rank, counts]:
+        every rank only fills its own min/max slots so a sum keeps them all
+        """
+        x = _flat(tensor)
+        world = self.world_size
+        row = torch.zeros(3 + 2 * world + bins, dtype=torch.float64, device=x.device)
+        row[0] = x.numel()
+        row[3 + self.rank] = float('inf')
+        row[3 + world + self.rank] = float('-inf')
+        if x.numel() > 0:
+            mn, mx = torch.aminmax(x)
+            row[1] = x.sum(dtype=torch.float64)
+            row[2] = torch.dot(x, x)
+            row[3 + self.rank] = mn
+            row[3 + world + self.rank] = mx
+            row[3 + 2 * world:] = torch.histc(x.clamp(lo, hi), bins=bins, min=lo, max=hi)
+        return row
+
+    def add_histograms(self, records, bins):
+        """ Bin (tag, tensor, global_step) records to be merged at the next reduction """
+        for tag, tensor, step in records:
+            lo, hi = self.ranges.get(tag, self.hist_range)
+            self.pending_histograms.append((tag, step, lo, hi, self._summarize(tensor, lo, hi, bins)))
+
+    def add_stat_records(self, moments):
+        """ Keep (tag, moments, global_step) records to be summed at the next reduction """
+        self.pending_stats.extend((tag, step, m) for tag, m, step in moments)
+
+    def add_scalar_records(self, scalars):
+        """ Keep (tag, 0-d tensor, global_step) records to be averaged at the next reduction """
+        self.pending_scalars.extend((tag, step, value) for tag, value, step in scalars)
+
+    def reduce_pending(self):
+        """ Merge everything pending with one all_reduce and write it on rank 0 """
+        if not (self.pending_histograms or self.pending_stats or self.pending_scalars):
+            return
+        # every rank has to lay out the buffer the same way
+        histograms = sorted(self.pending_histograms, key=lambda h: (h[0], h[1]))
+        stats = sorted(self.pending_stats, key=lambda s: (s[0], s[1]))
+        scalars = sorted(self.pending_scalars, key=lambda s: (s[0], s[1]))
+        self.pending_histograms, self.pending_stats, self.pending_scalars = [], [], []
+
+        parts = [row for _, _, _, _, row in histograms]
+        parts += [m.to(torch.float64) for _, _, m in stats]
+        if scalars:
+            device = parts[0].device if parts else scalars[0][2].device
+            parts.append(torch.stack([value.detach().to(device, torch.float64).reshape(())
+                                      for _, _, value in scalars]))
+        device = parts[0].device
+        flat = torch.cat([part.to(device) for part in parts])
+        dist.all_reduce(flat, group=self.group)
+        self.reductions += 1
+        flat = flat.cpu().numpy()
+
+        world = self.world_size
+        offset = 0
+        for tag, step, lo, hi, row in histograms:
+            merged = flat[offset:offset + row.numel()]
+            offset += row.numel()
+            mins, maxs = merged[3:3 + world], merged[3 + world:3 + 2 * world]
+            mins, maxs = mins[np.isfinite(mins)], maxs[np.isfinite(maxs)]
+            if merged[0] == 0:
+                continue
+            mn, mx = mins.min(), maxs.max()
+            if self.adaptive:
+                self.ranges[tag] = (mn, mx) if mn < mx else (mn - 0.5, mx + 0.5)
+            if self.rank == 0:
+                counts = merged[3 + 2 * world:]
+                host_row = np.concatenate([[mn, mx], merged[:3], counts])
+                limits = np.linspace(lo, hi, len(counts) + 1)
+                # values outside [lo, hi] were clamped into the edge buckets
+                if mn < mx:
+                    limits = np.clip(limits, mn, mx)
+                    limits[0], limits[-1] = mn, mx
+                self.writer.add_histogram_raw(tag, global_step=step,
+                                              **histogram_raw(host_row, limits))
+        if self.rank == 0:
+            merged_stats = []
+            for tag, step, m in stats:
+                merged_stats.append((tag, torch.from_numpy(flat[offset:offset + m.numel()]), step))
+                offset += m.numel()
+            add_scalar_records(self.writer, moment_stats(merged_stats))
+            for (tag, step, _), value in zip(scalars, flat[offset:]):
+                self.writer.add_scalar(tag, value / world, step)
+
+    def __getattr__(self, name):
+        """ Other add_* calls go straight to rank 0's writer and are dropped elsewhere """
+        if name in ('writer', 'add_summaries'):
+            # summaries binned over each rank's own range can't be merged
+            raise AttributeError(name)
+        if name.startswith('add_') and self.rank != 0:
+            return lambda *args, **kwargs: None
+        if self.writer is None:
+            raise AttributeError(name)
+        return getattr(self.writer, name)
+
+    def flush(self):
+        """ Reduce what is pending and flush rank 0's writer """
+        self.reduce_pending()
+        if self.rank == 0:
+            self.writer.flush()
+
+    def close(self):
+        """ Reduce what is pending and close rank 0's writer """
+        self.reduce_pending()
+        if self.rank == 0:
+            self.writer.close()
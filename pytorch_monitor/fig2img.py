@@ -1,13 +1,126 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+def _rgb_view(canvas):
+    """ The rendered RGB pixels as a (height, width, 3) view of the canvas' own buffer """
+    return np.asarray(canvas.buffer_rgba())[..., :3]
 
-def fig2img(fig, dpi=None, closefig=True):
+def fig2img(fig, dpi=None, closefig=True, copy=None):
+    """
+    Render a figure to a (height, width, 3) uint8 array for add_image(..., dataformats='HWC').
+
+    When the figure is closed the array is a view of its renderer's buffer,
+    which nothing draws to anymore, rather than a copy. A figure that is kept
+    could be drawn again, so by default it gets a copy; pass copy=False to get
+    the view anyway, or copy=True to always copy.
+    """
     if dpi is not None:
         fig.set_dpi(dpi)
-    fig.canvas.draw()
-    # Now we can save it to a numpy array.
-    data = np.fromstring(fig.canvas.tostring_rgb(), dtype=np.uint8, sep='')
-    data = data.reshape(fig.canvas.get_width_height()[::-1] + (3,))
+    canvas = fig.canvas
+    if not hasattr(canvas, 'buffer_rgba'):
+        canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    data = _rgb_view(canvas)
     if closefig:
+        import matplotlib.pyplot as plt
         plt.close(fig)
-    return data
+    if copy is None:
+        copy = not closefig
+    return data.copy() if copy else data
+
+class FigureRenderer(object):
+    """
+    Renders a stream of images with a single reusable Agg figure.
+
+    setup(fig) is called once to build the axes and artists and returns an
+    update(data) function that only changes them, e.g. with
+    AxesImage.set_data. See heatmap_setup for an example. The figure is not
+    managed by pyplot, so nothing has to be closed.
+    """
+    def __init__(self, setup, figsize=None, dpi=None):
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.update = setup(self.fig)
+
+    def render(self, data, copy=True):
+        """
+        Render one image. With copy=False the result is a view of the
+        renderer's buffer that the next render overwrites.
+        """
+        self.update(data)
+        self.canvas.draw()
+        img = _rgb_view(self.canvas)
+        return img.copy() if copy else img
+
+    def render_batch(self, datas):
+        """ Render a (n, height, width, 3) batch for add_images(..., dataformats='NHWC') """
+        batch = None
+        for i, data in enumerate(datas):
+            img = self.render(data, copy=False)
+            if batch is None:
+                batch = np.empty((len(datas),) + img.shape, dtype=img.dtype)
+            batch[i] = img
+        return batch
+
+def heatmap_setup(fig, cmap='viridis', vmin=None, vmax=None, colorbar=True):
+    """
+    FigureRenderer setup for matrices such as attention maps or confusion
+    matrices. Use functools.partial to change the keyword arguments.
+    Without vmin/vmax the color scale follows each matrix's range.
+    """
+    ax = fig.add_subplot(1, 1, 1)
+    im = ax.imshow(np.zeros((1, 1)), cmap=cmap, vmin=vmin, vmax=vmax,
+                   interpolation='nearest', aspect='auto')
+    if colorbar:
+        fig.colorbar(im, ax=ax)
+    def update(data):
+        data = np.asarray(data)
+        height, width = data.shape[:2]
+        im.set_data(data)
+        im.set_extent((-.5, width - .5, height - .5, -.5))
+        if vmin is None or vmax is None:
+            im.set_clim(data.min() if vmin is None else vmin,
+                        data.max() if vmax is None else vmax)
+    return update
+
+# one renderer per worker process of a RendererPool
+_worker_renderer = None
+
+def _init_worker(setup, figsize, dpi):
+    global _worker_renderer
+    _worker_renderer = FigureRenderer(setup, figsize, dpi)
+
+def _render_in_worker(data):
+    return _worker_renderer.render(data)
+
+class RendererPool(object):
+    """
+    A pool of processes, each with its own FigureRenderer over the Agg
+    backend, that renders batches in parallel. Starting the processes is
+    slow, so create the pool once and call map() for every batch (e.g. every
+    evaluation), then close() it. setup must be picklable, i.e. a module
+    level function or a functools.partial of one.
+    """
+    def __init__(self, setup, processes=None, figsize=None, dpi=None):
+        context = multiprocessing.get_context('spawn')
+        self.pool = ProcessPoolExecutor(processes, mp_context=context,
+                                        initializer=_init_worker,
+                                        initargs=(setup, figsize, dpi))
+
+    def map(self, datas, chunksize=1):
+        """ Render a (n, height, width, 3) batch for add_images(..., dataformats='NHWC') """
+        return np.stack(list(self.pool.map(_render_in_worker, datas, chunksize=chunksize)))
+
+    def close(self):
+        """ Stop the worker processes """
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,166 @@
+import numpy as np
+import torch
+
+# Layout of a summary row: the fixed statistics followed by `bins` counts
+MIN, MAX, NUM, SUM, SUM_SQUARES = range(5)
+NUM_STATS = 5
+
+def _flat(tensor):
+    """ Flatten a tensor into a 1d float view that histc and dot accept """
+    tensor = tensor.detach().reshape(-1)
+    if tensor.dtype not in (torch.float32, torch.float64):
+        tensor = tensor.float()
+    return tensor
+
+def _stats_dtype(device):
+    """ Accumulate summaries in double precision wherever the device allows it """
+    return torch.float32 if device.type == 'mps' else torch.float64
+
+def summarize(tensors, bins):
+    """
+    Reduce each tensor to a summary row on its own device.
+
+    Returns a (len(tensors), NUM_STATS + bins) tensor per device, as a list of
+    rows in the original order. Nothing is copied to the host; the counts are
+    binned over [min, max] of each tensor, just like numpy's default range.
+    Empty tensors have no histogram and get None.
+    """
+    rows = [None] * len(tensors)
+    by_device = {}
+    for i, tensor in enumerate(tensors):
+        if tensor.numel() > 0:
+            by_device.setdefault(tensor.device, []).append(i)
+
+    for device, idxs in by_device.items():
+        dtype = _stats_dtype(device)
+        flats = [_flat(tensors[i]) for i in idxs]
+        # one fused kernel for all of the sums of squares where supported
+        if hasattr(torch, '_foreach_norm'):
+            norms = torch._foreach_norm(flats)
+        else:
+            norms = [torch.linalg.vector_norm(x) for x in flats]
+        extrema = [torch.aminmax(x) for x in flats]
+        # three kernels per tensor (aminmax, sum, histc); the rest is done for all at once
+        stats = torch.stack([
+            torch.stack([lo for lo, _ in extrema]),
+            torch.stack([hi for _, hi in extrema]),
+            torch.tensor([x.numel() for x in flats], dtype=dtype, device=device),
+            torch.stack([x.sum(dtype=dtype) for x in flats]),
+            torch.stack(norms).to(dtype) ** 2,
+        ], dim=1)
+        # min=max=0 tells histc to bin over the data's own range
+        counts = torch.stack([torch.histc(x, bins=bins, min=0, max=0) for x in flats])
+        out = torch.cat([stats.to(dtype), counts.to(dtype)], dim=1)
+        for j, i in enumerate(idxs):
+            rows[i] = out[j]
+    return rows
+
+def subsample(tensor, budget):
+    """
+    At most budget elements of tensor to summarize instead of all of it:
+    whole rows (along the first dim) spread evenly over the tensor if a row
+    fits in the budget, evenly strided elements otherwise.
+    """
+    if budget is None or tensor.numel() <= budget:
+        return tensor
+    tensor = tensor.detach()
+    row_size = tensor[0].numel() if tensor.dim() > 1 else 0
+    if 0 < row_size <= budget:
+        idx = torch.linspace(0, tensor.shape[0] - 1, budget // row_size, device=tensor.device)
+        return tensor.index_select(0, idx.long())
+    flat = tensor.reshape(-1)
+    return flat[::-(-flat.numel() // budget)]
+
+def to_host(rows):
+    """ Copy summary rows to the host with one transfer per device """
+    host = [None] * len(rows)
+    by_device = {}
+    for i, row in enumerate(rows):
+        if row is not None:
+            by_device.setdefault(row.device, []).append(i)
+    for device, idxs in by_device.items():
+        stacked = torch.stack([rows[i] for i in idxs]).cpu().double().numpy()
+        for j, i in enumerate(idxs):
+            host[i] = stacked[j]
+    return host
+
+def histogram_raw(row, limits=None):
+    """
+    Turn a host summary row into add_histogram_raw's keyword arguments,
+    trimming empty outer buckets the same way tensorboardX does.
+    The bucket limits are spread over [min, max] unless given.
+    """
+    counts = row[NUM_STATS:]
+    if limits is None:
+        lo, hi = row[MIN], row[MAX]
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        limits = np.linspace(lo, hi, len(counts) + 1)
+
+    nonzero = np.flatnonzero(counts)
+    start, end = int(nonzero[0]), int(nonzero[-1]) + 1
+    # tensorboard only keeps right bucket limits, so keep an empty bucket on the left
+    if start > 0:
+        counts = counts[start - 1:end]
+    else:
+        counts = np.concatenate([[0], counts[:end]])
+    limits = limits[start:end + 1]
+
+    return dict(min=row[MIN],
+                max=row[MAX],
+                num=int(row[NUM]),
+                sum=row[SUM],
+                sum_squares=row[SUM_SQUARES],
+                bucket_limits=limits.tolist(),
+                bucket_counts=counts.tolist())
+
+def write_summaries(writer, tags, steps, rows):
+    """ Write already summarized rows, moving them to the host in one go """
+    for tag, step, row in zip(tags, steps, to_host(rows)):
+        if row is not None:
+            writer.add_histogram_raw(tag, global_step=step, **histogram_raw(row))
+
+def add_histograms(writer, records, bins):
+    """
+    Bin and write a batch of histograms.
+
+    `records` is a list of (tag, tensor, global_step) tuples. All tensors are
+    summarized on device and only the `bins`-sized summaries reach the host.
+    Writers that schedule histograms themselves (e.g. AsyncSummaryWriter)
+    define their own `add_histograms` and get the records as is.
+    """
+    if hasattr(writer, 'add_histograms'):
+        return writer.add_histograms(records, bins)
+    if not records:
+        return
+    tags, tensors, steps = zip(*records)
+    write_summaries(writer, tags, steps, summarize(tensors, bins))
+
+def summarize_records(writer, records, bins):
+    """
+    Reduce (tag, tensor, global_step) records to (tag, summary row,
+    global_step) right away so the tensors can be freed, to be written later
+    with add_summaries. Writers that bin histograms themselves but can't take
+    summaries (e.g. DistributedSummaryWriter) get the records now instead and
+    nothing is returned.
+    """
+    if not records:
+        return []
+    if hasattr(writer, 'add_histograms') and not hasattr(writer, 'add_summaries'):
+        writer.add_histograms(records, bins)
+        return []
+    tags, tensors, steps = zip(*records)
+    return list(zip(tags, summarize(tensors, bins), steps))
+
+def add_summaries(writer, records):
+    """
+    Write a batch of (tag, summary row, global_step) records made by
+    summarize_records. Writers that schedule writes themselves define their
+    own `add_summaries`.
+    """
+    if hasattr(writer, 'add_summaries'):
+        return writer.add_summaries(records)
+    if not records:
+        return
+    tags, rows, steps = zip(*records)
+    write_summaries(writer, tags, steps, rows)
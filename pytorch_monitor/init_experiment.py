@@ -1,65 +1,71 @@
 import socket
 import datetime
-import sh
+import subprocess
+import threading
 import os
 import json
 
 import random
-import numpy.random as npr
-import torch
 
-from tensorboardX import SummaryWriter
+# Seconds any single git command may take before it is killed
+GIT_TIMEOUT = 10.
 
-def commit(experiment_name, time):
+# Git snapshots still running in the background, see wait_for_git_snapshots
+_pending_snapshots = []
+
+# (config, fields) recorded in the background, merged by wait_for_git_snapshots
+_recorded_snapshots = []
+
+def git(*args, timeout=GIT_TIMEOUT):
+    """ Run a git command, returning its stdout. Raises if it fails or times out. """
+    result = subprocess.run(('git',) + args,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            stdin=subprocess.DEVNULL,
+                            universal_newlines=True,
+                            timeout=timeout,
+                            check=True)
+    return result.stdout
+
+def commit(experiment_name, time, timeout=GIT_TIMEOUT):
     """
     Try to commit repo exactly as it is when starting the experiment for reproducibility.
     """
     try:
-        sh.git.commit('-a',
-                m='"auto commit tracked files for new experiment: {} on {}"'.format(experiment_name, time),
-                allow_empty=True
-            )
-        commit_hash = sh.git('rev-parse', 'HEAD').strip()
-        return commit_hash
-    except:
+        git('commit', '-a', '--allow-empty',
+            '-m', 'auto commit tracked files for new experiment: {} on {}'.format(experiment_name, time),
+            timeout=timeout)
+        return git('rev-parse', 'HEAD', timeout=timeout).strip()
+    except Exception:
         return '<Unable to commit>'
 
-def init_experiment(config):
-    start_time = datetime.datetime.now().strftime('%b-%d-%y@%X')
-    host_name = socket.gethostname()
-    run_name = config.get('run_name', None)
-    if run_name is None:
-        run_name = '{}-{}'.format(start_time, host_name)
-    run_comment = config.get('run_comment', None)
-    if run_comment:
-        run_name += '-{}'.format(run_comment)
-    config['run_name'] = run_name
-
-    commit_run=True
-    if "commit_run" in config.keys():
-        commit_run=config["commit_run"]
-    
-    # create the needed run directory ifnexists
-    log_dir = config.get('log_dir', 'runs')
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    run_dir = os.path.join(log_dir, run_name)
-    if not os.path.exists(run_dir):
-        os.makedirs(run_dir)
-    config['run_dir'] = run_dir
-
-    writer = SummaryWriter(run_dir)
-
-    # commit if you can
+def git_snapshot(experiment_name, time, commit_run, timeout=GIT_TIMEOUT):
+    """
+    Capture what is needed to reproduce the working tree: the commit hash,
+    the diff of tracked files against HEAD and the list of untracked files.
+    With commit_run the tracked changes are committed first and the hash is
+    that of the new commit, otherwise it is the hash of HEAD.
+    """
+    snapshot = {}
+    try:
+        snapshot['git_untracked_files'] = git('ls-files', '--others', '--exclude-standard',
+                                              timeout=timeout).splitlines()
+        snapshot['git_diff'] = git('diff', 'HEAD', timeout=timeout)
+    except Exception:
+        snapshot['git_untracked_files'] = '<Unable to list>'
+        snapshot['git_diff'] = ''
     if commit_run:
-        commit_hash = commit(config.get('title', '<No Title'), start_time)
+        snapshot['commit_hash'] = commit(experiment_name, time, timeout)
     else:
-        commit_hash="<automatic commit dissabled >"
-
-    # create text summary for logging config to tensorboard
-    config['tag'] = 'Experiment Config: {} :: {}\n'.format(
-        config.get('title', '<No Title>'), start_time)
+        try:
+            head = git('rev-parse', 'HEAD', timeout=timeout).strip()
+        except Exception:
+            head = '<Unknown>'
+        snapshot['commit_hash'] = '{} (automatic commit disabled)'.format(head)
+    return snapshot
 
+def config_text(config, start_time, host_name, log_dir):
+    """ The text summary logging the config to tensorboard """
     text  = '<h3>{}</h3>\n'.format(config['tag'])
     text += '{}\n'.format(config.get('description', '<No Description>'))
 
@@ -69,28 +75,137 @@ def init_experiment(config):
     text += 'CWD: {}\n'.format(os.getcwd())
     text += 'PID: {}\n'.format(os.getpid())
     text += 'Log Dir: {}\n'.format(log_dir)
-    text += 'Commit Hash: {}\n'.format(commit_hash)
+    text += 'Commit Hash: {}\n'.format(config.get('commit_hash', '<Pending>'))
     text += 'Random Seed: {}\n'.format(config.get('random_seed', '<Unknown...BAD PRACTICE!>'))
     text += '</pre>\n<pre>'
 
-    skip_keys = ['tag', 'title', 'description', 'random_seed', 'log_dir', 'run_dir', 'run_name', 'run_comment']
+    skip_keys = ['tag', 'title', 'description', 'random_seed', 'log_dir', 'run_dir', 'run_name',
+                 'run_comment', 'commit_hash', 'git_untracked_files']
     for key, val in config.items():
         if key in skip_keys:
             continue
         text += '{}: {}\n'.format(key, val)
     text += '</pre>'
+    return text
+
+def save_config(config):
+    """ Save the config to the run dir """
+    with open(os.path.join(config['run_dir'], 'config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+
+def finish_experiment_record(record, writer, snapshot, start_time, host_name, log_dir):
+    """
+    Complete record, a copy of the config that nothing else uses, with a git
+    snapshot: save it as config.json, write the diff next to it and log the
+    config text summary. Returns the fields to add to the config itself.
+    """
+    diff = snapshot.pop('git_diff')
+    if diff:
+        snapshot['git_diff_file'] = 'git.diff'
+        with open(os.path.join(record['run_dir'], 'git.diff'), 'w') as f:
+            f.write(diff)
+    record.update(snapshot)
+    save_config(record)
+    try:
+        writer.add_text(record['tag'], config_text(record, start_time, host_name, log_dir), 0)
+    except Exception:
+        pass # the writer was closed before git finished
+    return snapshot
+
+def run_in_background(fn):
+    """ Run fn in a thread that wait_for_git_snapshots can wait on """
+    def run():
+        try:
+            fn()
+        finally:
+            _pending_snapshots.remove(thread)
+    thread = threading.Thread(target=run, name='git-snapshot')
+    _pending_snapshots.append(thread)
+    thread.start()
+
+def wait_for_git_snapshots(timeout=None):
+    """
+    Block until the git snapshots started by init_experiment are recorded and
+    add them (commit_hash etc.) to the configs it returned. Call it from the
+    thread that uses the config; config.json has them as soon as they are recorded.
+    """
+    for thread in list(_pending_snapshots):
+        thread.join(timeout)
+    while _recorded_snapshots:
+        config, fields = _recorded_snapshots.pop(0)
+        config.update(fields)
 
-    # set random seed
+def init_experiment(config):
+    start_time = datetime.datetime.now().strftime('%b-%d-%y@%X')
+    host_name = socket.gethostname()
+    run_name = config.get('run_name', None)
+    if run_name is None:
+        run_name = '{}-{}'.format(start_time, host_name)
+    run_comment = config.get('run_comment', None)
+    if run_comment:
+        run_name += '-{}'.format(run_comment)
+    config['run_name'] = run_name
+
+    # set random seed (on every rank)
     rseed = config.get('random_seed', None)
     if rseed is not None:
+        import numpy.random as npr
+        import torch
         random.seed(rseed)
         npr.seed(rseed)
         torch.manual_seed(rseed)
 
-    writer.add_text(config['tag'], text, 0)
+    # with torch.distributed only rank 0 keeps a run dir and writes summaries
+    if config.get('distributed', False):
+        from pytorch_monitor.distributed import DistributedSummaryWriter, is_writer_rank
+        if not is_writer_rank():
+            return DistributedSummaryWriter(None, config.get('hist_range', (-1., 1.))), config
 
-    # save the config to run dir
-    with open(os.path.join(config['run_dir'], 'config.json'), 'w') as f:
-        json.dump(config, f, indent=2)
+    commit_run=True
+    if "commit_run" in config.keys():
+        commit_run=config["commit_run"]
+
+    # create the needed run directory ifnexists
+    log_dir = config.get('log_dir', 'runs')
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    run_dir = os.path.join(log_dir, run_name)
+    if not os.path.exists(run_dir):
+        os.makedirs(run_dir)
+    config['run_dir'] = run_dir
+
+    backend = config.get('writer', 'tensorboard')
+    if backend == 'tensorboard':
+        from tensorboardX import SummaryWriter
+        writer = SummaryWriter(run_dir)
+    elif backend == 'columnar':
+        from pytorch_monitor.store import ColumnarWriter
+        writer = ColumnarWriter(run_dir, chunk_size=config.get('chunk_size', 4096))
+    else:
+        raise ValueError("config['writer'] must be 'tensorboard' or 'columnar', got {!r}".format(backend))
+    if config.get('async_logging', False):
+        from pytorch_monitor.async_writer import AsyncSummaryWriter
+        writer = AsyncSummaryWriter(writer,
+                                    max_queue=config.get('async_max_queue', 1024),
+                                    policy=config.get('async_drop_policy', 'block'))
+    if config.get('distributed', False):
+        writer = DistributedSummaryWriter(writer, config.get('hist_range', (-1., 1.)))
+
+    config['tag'] = 'Experiment Config: {} :: {}\n'.format(
+        config.get('title', '<No Title>'), start_time)
+
+    # save the config now and complete it with the git snapshot when that is ready
+    save_config(config)
+    # taken here, since training may change config while git runs in the background
+    record = dict(config)
+    def record_snapshot():
+        snapshot = git_snapshot(record.get('title', '<No Title>'), start_time, commit_run,
+                                record.get('git_timeout', GIT_TIMEOUT))
+        return finish_experiment_record(record, writer, snapshot, start_time, host_name, log_dir)
+    if config.get('background_git', True):
+        # the config is only completed on the caller's thread, by wait_for_git_snapshots
+        run_in_background(lambda: _recorded_snapshots.append((config, record_snapshot())))
+    else:
+        config.update(record_snapshot())
 
     return writer, config
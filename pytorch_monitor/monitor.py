@@ -1,57 +1,156 @@
-from tensorboardX import SummaryWriter
+import weakref
 
-def set_monitor(module):
-    """ Defines the monitor method on the module. """
+from pytorch_monitor.async_writer import AsyncSummaryWriter
+from pytorch_monitor.distributed import DistributedSummaryWriter
+from pytorch_monitor.histogram import add_histograms, add_summaries, subsample, summarize_records
+from pytorch_monitor.plan import CLOSED, MonitoringPlan, plan_signature
+from pytorch_monitor.schedule import make_schedule
+from pytorch_monitor.snapshot import make_update_tracker
+from pytorch_monitor.stats import add_scalar_records, add_stat_records, moment_records, norm_ratio_records
+
+def set_monitor(module, root=None):
+    """ Defines the monitor method on the module, a submodule of the monitored root """
+    root = module if root is None else root
     def monitor(name, tensor,
                 track_data=True,
-                track_grad=True):
+                track_grad=True,
+                eager=None,
+                sample=None):
         """
         Register the tensor under the name given (now a string)
         and track it based on the track_data and track_grad arguments.
+
+        With eager=True the tensor is summarized right away and its grad hook
+        registered, so only a weak reference to it is kept. sample caps the
+        number of elements summarized. Both default to what monitor_module
+        was given as eager_vars and var_sample.
         """
+        eager = getattr(root, 'eager_vars', False) if eager is None else eager
+        sample = getattr(root, 'var_sample', None) if sample is None else sample
         module.monitored_vars[name] = {
-            'tensor':tensor,
+            'tensor':weakref.ref(tensor) if eager else tensor,
             'track_data':track_data,
             'track_grad':track_grad,
+            'eager':eager,
+            'sample':sample,
         }
+        if eager and any(getattr(root, 'eager_gate', CLOSED)):
+            reduce_var(root, module, name, tensor, track_data, track_grad, sample)
     module.monitor = monitor
 
+def reduce_var(root, module, name, tensor, track_data, track_grad, sample):
+    """
+    Log a var of the forward pass in progress as soon as it is monitored:
+    reduce it to its summary and stats on device and register its grad hook,
+    so that nothing has to keep the tensor alive until the forward hook
+    """
+    plan = root.monitoring_plan
+    entry = plan.var(plan.prefixes[module], name)
+    histogram, stats = root.eager_gate
+    step = root.global_step
+    if track_grad and tensor.requires_grad:
+        hook = entry.hook
+        if sample is not None:
+            hook = lambda grad, hook=hook: hook(subsample(grad, sample))
+        root.var_hooks[entry.name] = tensor.register_hook(hook)
+    if track_data:
+        data = subsample(tensor, sample)
+        if histogram:
+            root.pending_summaries.extend(
+                summarize_records(plan.writer, [(entry.data_tag, data, step)], plan.bins))
+        if stats:
+            root.pending_stats.extend(moment_records([(entry.data_tag, data, step)]))
+
 def set_monitoring(module):
     """ Defines the monitoring method on the module. """
     def monitoring(is_monitoring,
                    track_data=None,
                    track_grad=None,
                    track_update=None,
-                   track_update_ratio=None):
+                   track_update_ratio=None,
+                   track_stats=None,
+                   track_histograms=None,
+                   schedule=None,
+                   update_tracker=None):
         """
         Turn monitoring on or off. If any of the keyword arguments
         are not None, they will be overwritten.
         """
+        if schedule is not None:
+            module.monitor_schedule = make_schedule(schedule)
+        if update_tracker is not None:
+            module.update_tracker = make_update_tracker(update_tracker)
         module.is_monitoring = is_monitoring
         module.track_data = track_data if track_data is not None else module.track_data
         module.track_grad = track_grad if track_grad is not None else module.track_grad
         module.track_update = track_update if track_update is not None else module.track_update
         module.track_update_ratio = track_update_ratio if track_update_ratio is not None else module.track_update_ratio
+        module.track_stats = track_stats if track_stats is not None else module.track_stats
+        module.track_histograms = track_histograms if track_histograms is not None else module.track_histograms
     module.monitoring = monitoring
 
-def grad_hook(module, name, writer, bins):
-    """ Factory for grad_hook closures """
-    def hook(grad):
-        writer.add_histogram('{}/grad'.format(name.replace('.','/')),
-                             grad.detach().cpu().numpy(),
-                             module.global_step-1,
-                             bins=bins)
-    return hook
+def set_submodules(module):
+    """ All submodules need to have the monitor method and monitored_vars """
+    for name, mod in module.named_modules():
+        if not hasattr(mod, 'monitor'):
+            set_monitor(mod, module)
+        if not hasattr(mod, 'monitored_vars'):
+            mod.monitored_vars = dict()
 
 def remove_grad_hooks(module, input):
-    """ Remove gradient hooks to all of the parameters and monitored vars """
-    for hook in list(module.param_hooks.keys()):
-        module.param_hooks[hook].remove()
-        module.param_hooks.pop(hook)
+    """ Remove gradient hooks to the monitored vars of the last forward pass """
+    if not module.var_hooks:
+        return
     for hook in list(module.var_hooks.keys()):
         module.var_hooks[hook].remove()
         module.var_hooks.pop(hook)
 
+def var_gate(module):
+    """ What monitored vars log at the current step, as (histogram, stats) """
+    if not module.is_monitoring:
+        return CLOSED
+    step = module.global_step
+    schedule = module.monitor_schedule
+    return (module.track_histograms and schedule['vars'](step),
+            module.track_stats and schedule['stats'](step))
+
+def update_plan(module, summary_writer, bins):
+    """ The module's MonitoringPlan, (re)built only when the structure of the module changed """
+    plan = module.monitoring_plan
+    if plan is not None and plan.checked_step == module.global_step:
+        return plan
+    if plan is None or plan.signature != plan_signature(module):
+        if plan is not None:
+            plan.remove()
+        set_submodules(module)
+        plan = module.monitoring_plan = MonitoringPlan(module, summary_writer, bins)
+    plan.checked_step = module.global_step
+    return plan
+
+def flush_pending(module, summary_writer):
+    """
+    Write what was summarized since the last forward hook: the grads of the
+    last backward pass and the eager vars of this forward pass
+    """
+    if module.pending_summaries:
+        add_summaries(summary_writer, module.pending_summaries)
+        module.pending_summaries = []
+    if module.pending_stats:
+        add_stat_records(summary_writer, module.pending_stats)
+        module.pending_stats = []
+    if hasattr(summary_writer, 'reduce_pending'):
+        # merge the last step across ranks (see DistributedSummaryWriter)
+        summary_writer.reduce_pending()
+
+def get_open_eager_vars(summary_writer, bins):
+    """ Get the forward pre-hook that lets eager vars log during the forward pass """
+    def open_eager_vars(module, input):
+        remove_grad_hooks(module, input)
+        module.eager_gate = var_gate(module)
+        if any(module.eager_gate):
+            update_plan(module, summary_writer, bins)
+    return open_eager_vars
+
 def get_monitor_forward_and_backward(summary_writer, bins):
     """ Get the method for monitoring the forward values of the network """
     def monitor_forward_and_backward(module, input, output):
@@ -60,49 +159,88 @@ def get_monitor_forward_and_backward(summary_writer, bins):
         Then iterate over all of the monitored_vars, monitor their forward values
         and set their grad_hooks
         """
+        module.eager_gate = CLOSED
+        flush_pending(module, summary_writer)
+        if not module.is_monitoring:
+            module.grad_gate = module.var_grad_gate = CLOSED
+            module.global_step += 1
+            return
+        step = module.global_step
+        schedule = module.monitor_schedule
+        histograms = module.track_histograms
+        stats = module.track_stats and schedule['stats'](step)
+        hist_data = histograms and module.track_data and schedule['data'](step)
+        hist_grad = histograms and module.track_grad and schedule['grad'](step)
+        hist_vars = var_gate(module)[0]
+        stats_data = stats and module.track_data
+        stats_grad = stats and module.track_grad
+        # the update logged at step-1 is the one made since the snapshot taken then,
+        # and a snapshot is only needed now if the update of this step will be logged
+        hist_update = histograms and module.track_update and schedule['update'](step-1)
+        stats_update = module.track_stats and module.track_update and schedule['stats'](step-1)
+        take_snapshot = module.track_update and ((histograms and schedule['update'](step)) or stats)
+        track_params = (hist_data or hist_update or stats_data or stats_update or take_snapshot)
+        track_vars = hist_vars or stats
+        module.grad_gate = (hist_grad, stats_grad)
+        module.var_grad_gate = (hist_vars, stats)
+        if not (track_params or track_vars or hist_grad or stats_grad):
+            module.update_tracker.clear()
+            module.global_step += 1
+            return
+
+        plan = update_plan(module, summary_writer, bins)
+
+        records, stat_inputs, ratio_inputs, ratio_scalars = [], [], [], []
         # Parameters
-        if module.is_monitoring:
-            param_names = [ name for name, _ in module.named_parameters()]
-            for name, param in zip(param_names, module.parameters()):
-                if module.track_grad and param.requires_grad:
-                    hook = grad_hook(module, name, summary_writer, bins)
-                    module.param_hooks[name] = param.register_hook(hook)
-                if module.track_data:
-                    summary_writer.add_histogram('{}/data'.format(name.replace('.','/')),
-                                                 param.detach().cpu().numpy(),
-                                                 module.global_step,
-                                                 bins=bins)
-                if name in module.last_state_dict:
-                    if module.track_update:
-                        update = param - module.last_state_dict[name]
-                        summary_writer.add_histogram('{}/update-val'.format(name.replace('.','/')),
-                                                     update.detach().cpu().numpy(),
-                                                     module.global_step-1,
-                                                     bins=bins)
-                    if module.track_update and module.track_update_ratio:
-                        update_ratio = update / (module.last_state_dict[name]+1e-15)
-
-                        summary_writer.add_histogram('{}/update-ratio'.format(name.replace('.','/')),
-                                                     update_ratio.detach().cpu().numpy(),
-                                                     module.global_step-1,
-                                                     bins=bins)
-                if module.track_update:
-                    module.last_state_dict[name] = param.clone()
-
-            # Intermediate Vars
-            for prefix, mod in module.named_modules():
-                for tensor_name, entry in mod.monitored_vars.items():
-                    name = '{}/{}'.format(prefix, tensor_name) if prefix else tensor_name
-                    tensor = entry['tensor']
-                    if entry['track_grad'] and tensor.requires_grad:
-                        hook = grad_hook(module, name, summary_writer, bins)
-                        module.var_hooks[name] = tensor.register_hook(hook)
-                    if entry['track_data']:
-                        summary_writer.add_histogram('{}/data'.format(name.replace('.','/')),
-                                                     tensor.detach().cpu().numpy(),
-                                                     module.global_step,
-                                                     bins=bins)
-            # Update step
+        if track_params:
+            for entry in plan.params:
+                param = entry.param
+                if hist_data:
+                    records.append((entry.data_tag, param, step))
+                if stats_data:
+                    stat_inputs.append((entry.data_tag, param, step))
+                if entry.name in module.update_tracker and (hist_update or stats_update):
+                    update, previous = module.update_tracker.update(entry.name, param)
+                    if hist_update:
+                        records.append((entry.update_tag, update, step-1))
+                    if hist_update and module.track_update_ratio:
+                        update_ratio = update / (previous+1e-15)
+                        records.append((entry.ratio_tag, update_ratio, step-1))
+                    if stats_update:
+                        stat_inputs.append((entry.update_stats_tag, update, step-1))
+                        ratio_inputs.append((entry.norm_ratio_tag, update, previous, step-1))
+            # previous may be the tracker's own buffer, so take its norm before it is overwritten
+            ratio_scalars = norm_ratio_records(ratio_inputs)
+            for entry in plan.params:
+                if take_snapshot:
+                    module.update_tracker.save(entry.name, entry.param)
+                else:
+                    module.update_tracker.pop(entry.name)
+
+        # Intermediate Vars
+        if track_vars:
+            for prefix, mod in plan.modules:
+                for tensor_name, var in mod.monitored_vars.items():
+                    if var['eager']:
+                        continue # already logged by monitor()
+                    entry = plan.var(prefix, tensor_name)
+                    tensor = var['tensor']
+                    if var['track_grad'] and tensor.requires_grad:
+                        hook = entry.hook
+                        if var['sample'] is not None:
+                            hook = lambda grad, hook=hook, sample=var['sample']: \
+                                hook(subsample(grad, sample))
+                        module.var_hooks[entry.name] = tensor.register_hook(hook)
+                    tensor = subsample(tensor, var['sample'])
+                    if var['track_data'] and hist_vars:
+                        records.append((entry.data_tag, tensor, step))
+                    if var['track_data'] and stats:
+                        stat_inputs.append((entry.data_tag, tensor, step))
+
+        # Reduce everything on device and write it in one batch
+        add_histograms(summary_writer, records, bins)
+        add_stat_records(summary_writer, moment_records(stat_inputs))
+        add_scalar_records(summary_writer, ratio_scalars)
         module.global_step += 1
     return monitor_forward_and_backward
 
@@ -111,7 +249,17 @@ def monitor_module(module, summary_writer,
                    track_grad=True,
                    track_update=True,
                    track_update_ratio=False, # this is usually unnecessary
-                   bins=51):
+                   track_stats=False,
+                   track_histograms=True,
+                   bins=51,
+                   async_logging=False,
+                   max_queue=1024,
+                   drop_policy='block',
+                   schedule=None,
+                   update_tracker=None,
+                   distributed=False,
+                   eager_vars=False,
+                   var_sample=None):
     """ Allows for remote monitoring of a module's params and buffers.
     The following may be monitored:
       1. Forward Values - Histograms of the values for parameter and buffer tensors
@@ -123,39 +271,102 @@ def monitor_module(module, summary_writer,
            I.e., what is the relative size of the update.
            Generally we like to see values of about .001.
            See [cite Andrej Karpathy's babysitting dnn's blog post]
-    """
 
+    With track_stats=True, scalars are logged alongside (or, with
+    track_histograms=False, instead of) the histograms: the L2 norm, mean, std
+    and fraction of zeros of every tracked data, grad and update tensor, and
+    the ratio of each parameter's update norm to its norm ('update-norm-ratio').
+    They are reduced for all tensors together and copied to the host once per step.
+
+    With async_logging=True, histograms are still binned on device in the hooks
+    but a background thread copies them to the host and writes them (see
+    AsyncSummaryWriter). The queue holds
+    at most max_queue records and drop_policy ('block' or 'drop') decides what
+    happens when it is full. Returns the writer the hooks log to, so it can be
+    flushed and closed.
+
+    schedule decides on which steps anything is logged: None for every step,
+    an int n for every n steps, a callable step -> bool (see
+    pytorch_monitor.schedule for every, log_spaced and warmup), or a dict
+    giving a separate cadence to 'data', 'grad', 'update' and 'vars' histograms
+    and to 'stats'.
+    On steps where nothing is scheduled the hooks only bump global_step.
+
+    update_tracker picks how parameter snapshots for update tracking are kept:
+    None or 'clone' for a copy of each parameter, 'flat' for one contiguous
+    buffer, 'sampled' for a fixed random subset of each parameter, or an
+    UpdateTracker from pytorch_monitor.snapshot, which can also store snapshots
+    at reduced precision or offloaded to the CPU. Its memory_footprint()
+    reports the bytes it holds.
+
+    Tags, the parameter list and one grad hook per parameter are set up once
+    in a MonitoringPlan and only rebuilt when the module's structure changes.
+    The parameter grad hooks stay registered and are opened per step; with
+    pytorch >= 2.1 they log the accumulated grad once it is in param.grad.
+    Grads are summarized on device in the hooks and written with the batch of
+    the next forward pass; call module.flush_monitoring() before closing the
+    writer to write those of the last backward pass.
+
+    With distributed=True, every rank of torch.distributed calls monitor_module
+    and histograms and stats are merged across ranks once per step and written
+    by rank 0 alone (see DistributedSummaryWriter); other ranks may pass None
+    as summary_writer. The returned writer must be closed on every rank.
+    Merged histograms are binned over a range shared by all ranks, taken from
+    the merged [min, max] of a tag's previous logged step, so it lags one
+    step behind; values outside it are counted in the edge buckets.
+
+    Vars passed to module.monitor() are kept until the forward hook runs,
+    which keeps large activations alive past their use. With eager_vars=True
+    monitor() summarizes them (histogram and stats) on the spot and registers
+    their grad hooks right away, keeping only a weak reference. var_sample
+    caps the number of elements of a var (and of its grad) that are
+    summarized, taking evenly spaced rows or elements.
+    Both can also be set per call of monitor().
+    """
+    if async_logging and summary_writer is not None and \
+            not isinstance(summary_writer, (AsyncSummaryWriter, DistributedSummaryWriter)):
+        summary_writer = AsyncSummaryWriter(summary_writer, max_queue, drop_policy)
+    if distributed and not isinstance(summary_writer, DistributedSummaryWriter):
+        summary_writer = DistributedSummaryWriter(summary_writer)
 
     # The module will need additional information
     module.track_data = track_data
     module.track_grad = track_grad
     module.track_update = track_update
     module.track_update_ratio = track_update_ratio
+    module.track_stats = track_stats
+    module.track_histograms = track_histograms
     if not hasattr(module, 'global_step'):
         module.global_step = 0
     if not hasattr(module, 'is_monitoring'):
         module.is_monitoring = True
     if not hasattr(module, 'monitoring'):
         set_monitoring(module)
-    if not hasattr(module, 'last_state_dict'):
-        module.last_state_dict = dict()
+    if not hasattr(module, 'update_tracker'):
+        module.update_tracker = make_update_tracker(None)
+    if not hasattr(module, 'pending_stats'):
+        module.pending_stats = []
     if not hasattr(module, 'var_hooks'):
         module.var_hooks = dict()
-    if not hasattr(module, 'param_hooks'):
-        module.param_hooks = dict()
+    if not hasattr(module, 'pending_summaries'):
+        module.pending_summaries = []
+    if not hasattr(module, 'monitoring_plan'):
+        module.monitoring_plan = None
+    module.eager_vars = eager_vars
+    module.var_sample = var_sample
+    module.grad_gate = module.var_grad_gate = module.eager_gate = CLOSED
+    module.flush_monitoring = lambda: flush_pending(module, summary_writer)
 
-    # All submodules need to have these
-    for name, mod in module.named_modules():
-        if not hasattr(mod, 'monitor'):
-            set_monitor(mod)
-        if not hasattr(mod, 'monitored_vars'):
-            mod.monitored_vars = dict()
+    set_submodules(module)
 
-    module.monitoring(True)
+    module.monitoring(True,
+                      schedule=schedule if schedule is not None else 1,
+                      update_tracker=update_tracker)
 
-    # remove previous grad hooks before handles go stale
-    module.register_forward_pre_hook(remove_grad_hooks)
+    # remove previous var grad hooks before handles go stale and open the eager vars
+    module.register_forward_pre_hook(get_open_eager_vars(summary_writer, bins))
 
-    # set forward hook that monitors forward activations and sets new grad hooks
+    # set forward hook that monitors forward activations and opens the grad hooks
     monitor_forward_and_backward = get_monitor_forward_and_backward(summary_writer, bins)
     module.register_forward_hook(monitor_forward_and_backward)
+    return summary_writer
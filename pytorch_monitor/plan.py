@@ -0,0 +1,103 @@
+from collections import namedtuple
+
+from pytorch_monitor.histogram import summarize_records
+from pytorch_monitor.stats import moment_records
+
+# What the gated grad hooks log, as (histogram, stats); CLOSED logs nothing
+CLOSED = (False, False)
+
+ParamEntry = namedtuple('ParamEntry', [
+    'name', 'param',
+    'data_tag', 'grad_tag', 'update_tag', 'ratio_tag', 'update_stats_tag', 'norm_ratio_tag',
+])
+VarEntry = namedtuple('VarEntry', ['name', 'data_tag', 'grad_tag', 'hook'])
+
+def log_grad(module, writer, bins, tag, grad, gate):
+    """ Log a gradient the way gate says to, at the step of its forward pass """
+    histogram, stats = gate
+    step = module.global_step-1
+    if histogram:
+        # summarized on device now and written with the next forward's batch
+        module.pending_summaries.extend(summarize_records(writer, [(tag, grad, step)], bins))
+    if stats:
+        # reduced on device now and written with the next forward's batch
+        module.pending_stats.extend(moment_records([(tag, grad, step)]))
+
+def gated_grad_hook(module, writer, bins, tag, gate):
+    """
+    Factory for grad hooks that stay registered and only log when the gate
+    attribute of module (e.g. 'grad_gate') is open
+    """
+    def hook(grad):
+        state = getattr(module, gate)
+        if state is not CLOSED:
+            log_grad(module, writer, bins, tag, grad, state)
+    return hook
+
+def plan_signature(module):
+    """ Changes whenever parameters or submodules are added, removed or (un)frozen """
+    return (tuple(id(mod) for mod in module.modules()),
+            tuple((id(param), param.requires_grad) for param in module.parameters()))
+
+class MonitoringPlan(object):
+    """
+    Everything about a module that monitoring needs and that only changes with
+    the module's structure: the parameters with their pre-formatted tags, the
+    submodules that may hold monitored vars, and one persistent grad hook per
+    trainable parameter, gated by module.grad_gate.
+
+    Build it with the module's current structure and call remove() before
+    replacing it; monitor_module does both whenever plan_signature changes.
+    """
+    def __init__(self, module, writer, bins):
+        self.module = module
+        self.writer = writer
+        self.bins = bins
+        self.signature = plan_signature(module)
+        params = []
+        for name, param in module.named_parameters():
+            tag = name.replace('.','/')
+            params.append(ParamEntry(name, param,
+                                     data_tag='{}/data'.format(tag),
+                                     grad_tag='{}/grad'.format(tag),
+                                     update_tag='{}/update-val'.format(tag),
+                                     ratio_tag='{}/update-ratio'.format(tag),
+                                     update_stats_tag='{}/update'.format(tag),
+                                     norm_ratio_tag='{}/update-norm-ratio'.format(tag)))
+        self.params = tuple(params)
+        self.modules = tuple(module.named_modules())
+        self.prefixes = {mod:prefix for prefix, mod in self.modules}
+        self.checked_step = None # the last global_step the signature was checked at
+        self.vars = dict() # (prefix, tensor_name) -> VarEntry, filled as vars show up
+
+        self.handles = []
+        for entry in self.params:
+            if entry.param.requires_grad:
+                hook = gated_grad_hook(module, writer, bins, entry.grad_tag, 'grad_gate')
+                if hasattr(entry.param, 'register_post_accumulate_grad_hook'):
+                    handle = entry.param.register_post_accumulate_grad_hook(
+                        lambda param, hook=hook: hook(param.grad))
+                else:
+                    # older pytorch: log the incoming grad instead of the accumulated one
+                    handle = entry.param.register_hook(hook)
+                self.handles.append(handle)
+
+    def var(self, prefix, tensor_name):
+        """ The cached tags and grad hook of a monitored var """
+        key = (prefix, tensor_name)
+        if key not in self.vars:
+            name = '{}/{}'.format(prefix, tensor_name) if prefix else tensor_name
+            tag = name.replace('.','/')
+            grad_tag = '{}/grad'.format(tag)
+            self.vars[key] = VarEntry(name,
+                                      data_tag='{}/data'.format(tag),
+                                      grad_tag=grad_tag,
+                                      hook=gated_grad_hook(self.module, self.writer, self.bins,
+                                                           grad_tag, 'var_grad_gate'))
+        return self.vars[key]
+
+    def remove(self):
+        """ Remove the persistent grad hooks """
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
@@ -0,0 +1,67 @@
+import math
+
+# The kinds of summaries that can each have their own cadence
+CATEGORIES = ('data', 'grad', 'update', 'vars', 'stats')
+
+def always(step):
+    """ Monitor every step """
+    return True
+
+def never(step):
+    """ Never monitor """
+    return False
+
+def every(n, start=0):
+    """ Monitor every n steps, beginning at step start """
+    if n < 1:
+        raise ValueError('n must be a positive number of steps, got {}'.format(n))
+    def schedule(step):
+        return step >= start and (step - start) % n == 0
+    return schedule
+
+def log_spaced(base=2.):
+    """ Monitor step 0 and every step that is a (floored) power of base """
+    if base <= 1:
+        raise ValueError('base must be greater than 1, got {}'.format(base))
+    def schedule(step):
+        if step < 1:
+            return step == 0
+        k = int(math.log(step, base))
+        # guard against rounding in the log by checking the neighbouring powers
+        return any(int(base**j) == step for j in (k-1, k, k+1) if j >= 0)
+    return schedule
+
+def warmup(dense_steps, n):
+    """ Monitor every step for the first dense_steps steps, then every n steps """
+    sparse = every(n, start=dense_steps)
+    def schedule(step):
+        return step < dense_steps or sparse(step)
+    return schedule
+
+def as_schedule(spec):
+    """ Turn None (every step), an int (every n steps) or a callable into a schedule """
+    if spec is None:
+        return always
+    if isinstance(spec, int):
+        return every(spec)
+    if callable(spec):
+        return spec
+    raise TypeError('Cannot make a schedule out of {!r}'.format(spec))
+
+def make_schedule(spec):
+    """
+    Build the per-category schedule used by monitor_module.
+
+    spec can be anything as_schedule accepts, which then applies to all of the
+    categories, or a dict from category ('data', 'grad', 'update' and 'vars'
+    histograms, and 'stats' scalars) to such a spec. Categories missing from
+    the dict use its 'default' entry, which itself defaults to every step.
+    """
+    if not isinstance(spec, dict):
+        return {category:as_schedule(spec) for category in CATEGORIES}
+    unknown = set(spec) - set(CATEGORIES) - {'default'}
+    if unknown:
+        raise ValueError('Unknown schedule categories: {}'.format(sorted(unknown)))
+    default = as_schedule(spec.get('default', None))
+    return {category:as_schedule(spec[category]) if category in spec else default
+            for category in CATEGORIES}
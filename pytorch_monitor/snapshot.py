@@ -0,0 +1,220 @@
+import abc
+
+import torch
+
+class UpdateTracker(abc.ABC):
+    """
+    Keeps the parameter snapshots that update histograms are computed against.
+
+    dtype stores the snapshots at reduced precision (e.g. torch.float16 or
+    torch.bfloat16), device stores them elsewhere (e.g. 'cpu' to offload them
+    from the accelerator) and pin_memory puts CPU snapshots of accelerator
+    parameters in pinned memory so copies don't block the host.
+    Subclasses decide how the snapshots are laid out in memory. Forgetting a
+    snapshot (pop, clear) keeps its memory for the next save; only release
+    frees it.
+    """
+    def __init__(self, dtype=None, device=None, pin_memory=False):
+        self.dtype = dtype
+        self.device = torch.device(device) if device is not None else None
+        self.pin_memory = pin_memory
+
+    def select(self, name, param):
+        """ The values of param that are tracked """
+        return param.detach()
+
+    def _empty_like(self, values):
+        """ Allocate storage for a snapshot of values """
+        device = self.device if self.device is not None else values.device
+        pin = self.pin_memory and device.type == 'cpu' and values.device.type != 'cpu'
+        return torch.empty(values.shape,
+                           dtype=self.dtype or values.dtype,
+                           device=device,
+                           pin_memory=pin)
+
+    def _copy(self, buf, values):
+        buf.copy_(values, non_blocking=buf.is_pinned())
+
+    @abc.abstractmethod
+    def __contains__(self, name):
+        """ Whether name has a snapshot to compute an update against """
+
+    @abc.abstractmethod
+    def save(self, name, param):
+        """ Snapshot param, reusing the previous snapshot's memory if possible """
+
+    @abc.abstractmethod
+    def previous(self, name):
+        """ The snapshot of name as stored """
+
+    @abc.abstractmethod
+    def pop(self, name):
+        """ Forget the snapshot of name """
+
+    @abc.abstractmethod
+    def clear(self):
+        """ Forget all snapshots """
+
+    @abc.abstractmethod
+    def release(self):
+        """ Forget all snapshots and free their memory """
+
+    @abc.abstractmethod
+    def memory_footprint(self):
+        """ Bytes held for snapshots (and bookkeeping tensors) """
+
+    def update(self, name, param):
+        """ Returns (update, previous) for the tracked values of param """
+        values = self.select(name, param)
+        previous = self.previous(name).to(device=values.device, dtype=values.dtype,
+                                          non_blocking=True)
+        return values - previous, previous
+
+class CloneTracker(UpdateTracker):
+    """
+    One snapshot tensor per parameter. With no options this is a plain clone.
+    The tensors are kept and refilled in place when a snapshot is forgotten
+    and saved again.
+    """
+    def __init__(self, dtype=None, device=None, pin_memory=False):
+        super(CloneTracker, self).__init__(dtype, device, pin_memory)
+        self.snapshots = dict()
+        self.saved = set()
+
+    def __contains__(self, name):
+        return name in self.saved
+
+    def save(self, name, param):
+        values = self.select(name, param)
+        buf = self.snapshots.get(name)
+        if buf is None or buf.shape != values.shape:
+            buf = self.snapshots[name] = self._empty_like(values)
+        self._copy(buf, values)
+        self.saved.add(name)
+
+    def previous(self, name):
+        return self.snapshots[name]
+
+    def pop(self, name):
+        self.saved.discard(name)
+
+    def clear(self):
+        self.saved.clear()
+
+    def release(self):
+        self.saved.clear()
+        self.snapshots.clear()
+
+    def memory_footprint(self):
+        return sum(buf.numel() * buf.element_size() for buf in self.snapshots.values())
+
+class FlatTracker(UpdateTracker):
+    """
+    All snapshots live in one contiguous buffer that is updated in place.
+    The buffer grows while new parameters are seen (normally only on the first
+    snapshot) and is never reallocated after that. Unless dtype or device are
+    given, it takes those of the first parameter saved.
+    """
+    def __init__(self, dtype=None, device=None, pin_memory=False):
+        super(FlatTracker, self).__init__(dtype, device, pin_memory)
+        self.buffer = None
+        self.layout = dict() # name -> (offset, shape)
+        self.saved = set()
+
+    def __contains__(self, name):
+        return name in self.saved
+
+    def _grow(self, name, values):
+        if self.buffer is None:
+            offset = 0
+            self.buffer = self._empty_like(values.reshape(-1))
+        else:
+            offset = self.buffer.numel()
+            grown = torch.empty(offset + values.numel(),
+                                dtype=self.buffer.dtype,
+                                device=self.buffer.device,
+                                pin_memory=self.buffer.is_pinned())
+            grown[:offset].copy_(self.buffer)
+            self.buffer = grown
+        self.layout[name] = (offset, values.shape)
+
+    def _view(self, name):
+        offset, shape = self.layout[name]
+        return self.buffer[offset:offset + shape.numel()].view(shape)
+
+    def save(self, name, param):
+        values = self.select(name, param)
+        if name not in self.layout or self.layout[name][1] != values.shape:
+            self._grow(name, values)
+        self._copy(self._view(name), values)
+        self.saved.add(name)
+
+    def previous(self, name):
+        return self._view(name)
+
+    def pop(self, name):
+        self.saved.discard(name)
+
+    def clear(self):
+        self.saved.clear()
+
+    def release(self):
+        self.saved.clear()
+        self.buffer = None
+        self.layout.clear()
+
+    def memory_footprint(self):
+        if self.buffer is None:
+            return 0
+        return self.buffer.numel() * self.buffer.element_size()
+
+class SampledTracker(CloneTracker):
+    """
+    Tracks a fixed random subset of at most k elements of every parameter,
+    so update histograms are estimated from the sample.
+    The subset is drawn once per parameter from a generator seeded with seed.
+    """
+    def __init__(self, k=1024, seed=0, dtype=None, device=None, pin_memory=False):
+        super(SampledTracker, self).__init__(dtype, device, pin_memory)
+        self.k = k
+        self.generator = torch.Generator().manual_seed(seed)
+        self.indices = dict()
+
+    def select(self, name, param):
+        flat = param.detach().reshape(-1)
+        if flat.numel() <= self.k:
+            return flat
+        idx = self.indices.get(name)
+        if idx is None or idx.device != flat.device:
+            idx = self._draw(flat.numel())
+            idx = self.indices[name] = idx.sort().values.to(flat.device)
+        return flat[idx]
+
+    def _draw(self, n):
+        """ k distinct random indices below n, without a permutation of all n of them """
+        drawn = torch.empty(0, dtype=torch.long)
+        while drawn.numel() < self.k:
+            more = torch.randint(n, (2 * self.k,), generator=self.generator)
+            drawn = torch.cat([drawn, more]).unique()
+        # a random k of the distinct draws, since unique() sorts them
+        return drawn[torch.randperm(drawn.numel(), generator=self.generator)[:self.k]]
+
+    def memory_footprint(self):
+        index_bytes = sum(idx.numel() * idx.element_size() for idx in self.indices.values())
+        return super(SampledTracker, self).memory_footprint() + index_bytes
+
+TRACKERS = {
+    'clone':CloneTracker,
+    'flat':FlatTracker,
+    'sampled':SampledTracker,
+}
+
+def make_update_tracker(spec):
+    """ An UpdateTracker from an instance, a name in TRACKERS or None (plain clones) """
+    if spec is None:
+        return CloneTracker()
+    if isinstance(spec, UpdateTracker):
+        return spec
+    if spec in TRACKERS:
+        return TRACKERS[spec]()
+    raise ValueError('Unknown update tracker {!r}, use one of {}'.format(spec, sorted(TRACKERS)))
@@ -0,0 +1,121 @@
+import torch
+
+from pytorch_monitor.histogram import _flat, _stats_dtype
+
+# The scalars logged for every tracked tensor, in the order they are computed
+STATS = ('norm', 'mean', 'std', 'sparsity')
+
+def _norms(flats):
+    """ L2 norms of a list of same-device tensors, fused where supported """
+    if hasattr(torch, '_foreach_norm'):
+        return torch._foreach_norm(flats)
+    return [torch.linalg.vector_norm(x) for x in flats]
+
+# Layout of the moments a tensor's stats are derived from. They add up across
+# tensors (e.g. the shards of a tensor on different ranks): the count, the sum,
+# the sum of squared deviations from the tensor's own mean, count * mean**2
+# and the number of non-zeros.
+NUM, SUM, DEVIATIONS, MEAN_SQUARES, NONZERO = range(5)
+NUM_MOMENTS = 5
+
+def moment_records(records):
+    """
+    Reduce (tag, tensor, global_step) records to (tag, moments, global_step),
+    with the moments of each tensor in a NUM_MOMENTS vector on its device.
+
+    The mean and the deviations come from a centered pass (torch.std_mean)
+    so the std doesn't cancel catastrophically for tensors whose mean is much
+    larger than their std, like LayerNorm weights.
+    """
+    moments = []
+    for tag, tensor, step in records:
+        if tensor.numel() == 0:
+            continue
+        x = _flat(tensor)
+        dtype = _stats_dtype(x.device)
+        n = x.numel()
+        std, mean = torch.std_mean(x, correction=1 if n > 1 else 0)
+        mean, std = mean.to(dtype), std.to(dtype)
+        moments.append((tag, torch.stack([
+            torch.full_like(mean, n),
+            mean * n,
+            std**2 * max(n - 1, 1),
+            mean**2 * n,
+            torch.count_nonzero(x).to(dtype),
+        ]), step))
+    return moments
+
+def moment_stats(moments):
+    """
+    Expand (tag, moments, global_step) records into one scalar record per
+    stat, e.g. ('fc/weight/data-norm', <0-d tensor>, step), on the moments' device
+    """
+    scalars = []
+    for tag, m, step in moments:
+        n = m[NUM]
+        mean = m[SUM] / n
+        # deviations from the overall mean, for moments summed over several tensors
+        deviations = m[DEVIATIONS] + m[MEAN_SQUARES] - n * mean**2
+        std = (deviations.clamp(min=0) / (n - 1).clamp(min=1)).sqrt()
+        norm = (m[DEVIATIONS] + m[MEAN_SQUARES]).clamp(min=0).sqrt()
+        sparsity = 1. - m[NONZERO] / n
+        for stat, value in zip(STATS, (norm, mean, std, sparsity)):
+            scalars.append(('{}-{}'.format(tag, stat), value, step))
+    return scalars
+
+def stat_records(records):
+    """
+    Expand (tag, tensor, global_step) records into one scalar record per stat,
+    e.g. ('fc/weight/data-norm', <0-d tensor>, step), computed on device.
+    """
+    return moment_stats(moment_records(records))
+
+def norm_ratio_records(records):
+    """
+    For (tag, numerator, denominator, global_step) records, the ratio of the
+    L2 norms, e.g. of a parameter's update to the parameter itself.
+    """
+    by_device = {}
+    for record in records:
+        by_device.setdefault(record[1].device, []).append(record)
+
+    scalars = []
+    for device, group in by_device.items():
+        numerators = [_flat(num) for _, num, _, _ in group]
+        denominators = [_flat(den) for _, _, den, _ in group]
+        norms = _norms(numerators + denominators)
+        for i, (tag, _, _, step) in enumerate(group):
+            scalars.append((tag, norms[i] / (norms[len(group) + i] + 1e-15), step))
+    return scalars
+
+def add_scalar_records(writer, scalars):
+    """
+    Write (tag, 0-d tensor, global_step) records with a single host transfer
+    per device. Writers that schedule scalars themselves define their own
+    `add_scalar_records` and get the records as is.
+    """
+    if hasattr(writer, 'add_scalar_records'):
+        return writer.add_scalar_records(scalars)
+    if not scalars:
+        return
+    by_device = {}
+    for i, (_, value, _) in enumerate(scalars):
+        by_device.setdefault(value.device, []).append(i)
+    values = [None] * len(scalars)
+    for device, idxs in by_device.items():
+        host = torch.stack([scalars[i][1].double() for i in idxs]).cpu().tolist()
+        for i, value in zip(idxs, host):
+            values[i] = value
+    for (tag, _, step), value in zip(scalars, values):
+        writer.add_scalar(tag, value, step)
+
+def add_stat_records(writer, moments):
+    """
+    Write the stats of (tag, moments, global_step) records made by
+    moment_records. Writers that merge stats themselves (e.g.
+    DistributedSummaryWriter) define their own `add_stat_records` and get
+    the moments as is.
+    """
+    if hasattr(writer, 'add_stat_records'):
+        return writer.add_stat_records(moments)
+    add_scalar_records(writer, moment_stats(moments))
@@ -0,0 +1,254 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Everything lives under this directory of the run dir
+STORE_DIR = 'metrics'
+INDEX_FILE = 'index.json'
+
+SCALAR_FIELDS = [('step', '<i8'), ('wall_time', '<f8'), ('value', '<f8')]
+HISTOGRAM_FIELDS = [('step', '<i8'), ('wall_time', '<f8'),
+                    ('min', '<f8'), ('max', '<f8'), ('num', '<f8'),
+                    ('sum', '<f8'), ('sum_squares', '<f8')]
+
+def histogram_dtype(width):
+    """ Histogram rows with room for width buckets; unused limits are NaN and counts 0 """
+    return np.dtype(HISTOGRAM_FIELDS + [('bucket_limits', '<f8', (width,)),
+                                        ('bucket_counts', '<f8', (width,))])
+
+def _step(global_step):
+    return -1 if global_step is None else int(global_step)
+
+class ColumnarWriter(object):
+    """
+    A drop-in for the parts of SummaryWriter that monitoring uses which stores
+    scalars and histograms as per-tag NumPy arrays instead of event files.
+
+    Each tag gets a directory of .npy chunks of at most chunk_size rows, each
+    row holding the step, the wall time and the values. An index of the
+    chunks' step ranges lets MetricsReader memory-map only the chunks a query
+    needs. Rows are buffered per tag and written when a chunk fills up or on
+    flush()/close(); use export_tensorboard to get event files for the UI.
+    A store that already exists in log_dir (e.g. of a resumed run) is appended
+    to in new chunks.
+    """
+    def __init__(self, log_dir, chunk_size=4096):
+        self.log_dir = log_dir
+        self.root = os.path.join(log_dir, STORE_DIR)
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        self.chunk_size = chunk_size
+        index_path = os.path.join(self.root, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'tags':{}, 'texts':[]}
+        self.buffers = dict() # tag -> rows of the chunk being filled
+        self.open_chunks = set() # tags whose last chunk this writer started
+        self.lock = threading.Lock()
+
+    def _tag_entry(self, tag, kind):
+        entry = self.index['tags'].get(tag)
+        if entry is None:
+            entry = self.index['tags'][tag] = {
+                'kind':kind,
+                'dir':'t{:05d}'.format(len(self.index['tags'])),
+                'chunks':[],
+            }
+            os.makedirs(os.path.join(self.root, entry['dir']))
+        elif entry['kind'] != kind:
+            raise ValueError('Tag {!r} already holds {}s'.format(tag, entry['kind']))
+        if tag not in self.buffers:
+            self.buffers[tag] = []
+        return entry
+
+    def _append(self, tag, kind, row):
+        with self.lock:
+            entry = self._tag_entry(tag, kind)
+            rows = self.buffers[tag]
+            rows.append(row)
+            if len(rows) >= self.chunk_size:
+                self._write_chunk(tag, entry, rows)
+                self.buffers[tag] = []
+                self._write_index()
+
+    def _write_chunk(self, tag, entry, rows):
+        """ Write the open chunk of tag, replacing its earlier partial version """
+        if entry['kind'] == 'scalar':
+            data = np.array(rows, dtype=SCALAR_FIELDS)
+        else:
+            width = max(len(row[-1]) for row in rows)
+            data = np.zeros(len(rows), dtype=histogram_dtype(width))
+            data['bucket_limits'] = np.nan
+            for i, row in enumerate(rows):
+                for (field, _), value in zip(HISTOGRAM_FIELDS, row[:-2]):
+                    data[field][i] = value
+                data['bucket_limits'][i, :len(row[-2])] = row[-2]
+                data['bucket_counts'][i, :len(row[-1])] = row[-1]
+        chunks = entry['chunks']
+        # only the last chunk written by this writer is rewritten, never one of an earlier writer
+        if not chunks or chunks[-1]['rows'] >= self.chunk_size or tag not in self.open_chunks:
+            chunks.append({'file':'{:05d}.npy'.format(len(chunks))})
+            self.open_chunks.add(tag)
+        chunk = chunks[-1]
+        np.save(os.path.join(self.root, entry['dir'], chunk['file']), data)
+        steps = data['step']
+        chunk.update(rows=len(data),
+                     first_step=int(steps.min()),
+                     last_step=int(steps.max()),
+                     sorted=bool(np.all(steps[1:] >= steps[:-1])))
+
+    def _write_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.index, f)
+        os.replace(path + '.tmp', path)
+
+    def add_scalar(self, tag, scalar_value, global_step=None, walltime=None):
+        self._append(tag, 'scalar', (_step(global_step),
+                                     walltime if walltime is not None else time.time(),
+                                     float(scalar_value)))
+
+    def add_histogram_raw(self, tag, min, max, num, sum, sum_squares,
+                          bucket_limits, bucket_counts, global_step=None, walltime=None):
+        if len(bucket_limits) != len(bucket_counts):
+            raise ValueError('len(bucket_limits) != len(bucket_counts)')
+        self._append(tag, 'histogram', (_step(global_step),
+                                        walltime if walltime is not None else time.time(),
+                                        float(min), float(max), float(num),
+                                        float(sum), float(sum_squares),
+                                        np.asarray(bucket_limits, dtype=np.float64),
+                                        np.asarray(bucket_counts, dtype=np.float64)))
+
+    def add_histogram(self, tag, values, global_step=None, bins=51, walltime=None):
+        """ Bin values (a tensor or array) with the same engine monitor_module uses """
+        import torch
+        from pytorch_monitor.histogram import histogram_raw, summarize, to_host
+        row, = to_host(summarize([torch.as_tensor(values)], bins))
+        if row is not None:
+            self.add_histogram_raw(tag, global_step=global_step, walltime=walltime,
+                                   **histogram_raw(row))
+
+    def add_text(self, tag, text_string, global_step=None, walltime=None):
+        with self.lock:
+            self.index['texts'].append({
+                'tag':tag,
+                'text':text_string,
+                'step':_step(global_step),
+                'wall_time':walltime if walltime is not None else time.time(),
+            })
+            self._write_index()
+
+    def flush(self):
+        """ Write every partially filled chunk and the index """
+        with self.lock:
+            for tag, rows in self.buffers.items():
+                if rows:
+                    self._write_chunk(tag, self.index['tags'][tag], rows)
+            self._write_index()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class MetricsReader(object):
+    """
+    Queries a ColumnarWriter store by tag and step range. Only the chunks
+    overlapping the range are opened, memory-mapped, so reading a few steps
+    of one tag doesn't scan the rest of the run.
+    """
+    def __init__(self, log_dir):
+        self.root = os.path.join(log_dir, STORE_DIR)
+        with open(os.path.join(self.root, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+    def tags(self, kind=None):
+        """ All tags, or those holding kind ('scalar' or 'histogram') """
+        return sorted(tag for tag, entry in self.index['tags'].items()
+                      if kind is None or entry['kind'] == kind)
+
+    def texts(self):
+        return list(self.index['texts'])
+
+    def _read(self, tag, kind, start, stop):
+        entry = self.index['tags'].get(tag)
+        if entry is None or entry['kind'] != kind:
+            raise KeyError('No {}s under tag {!r}'.format(kind, tag))
+        parts = []
+        for chunk in entry['chunks']:
+            if start is not None and chunk['last_step'] < start:
+                continue
+            if stop is not None and chunk['first_step'] >= stop:
+                continue
+            data = np.load(os.path.join(self.root, entry['dir'], chunk['file']), mmap_mode='r')
+            steps = data['step']
+            if chunk['sorted']:
+                lo = 0 if start is None else np.searchsorted(steps, start, side='left')
+                hi = len(steps) if stop is None else np.searchsorted(steps, stop, side='left')
+                parts.append(np.array(data[lo:hi]))
+            else:
+                keep = np.ones(len(steps), dtype=bool)
+                if start is not None:
+                    keep &= steps >= start
+                if stop is not None:
+                    keep &= steps < stop
+                parts.append(np.array(data[keep]))
+        return parts
+
+    def scalars(self, tag, start=None, stop=None):
+        """ Structured array of (step, wall_time, value) rows with start <= step < stop """
+        parts = self._read(tag, 'scalar', start, stop)
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=SCALAR_FIELDS)
+
+    def histograms(self, tag, start=None, stop=None):
+        """
+        Structured array of histogram rows with start <= step < stop. Rows are
+        padded to the widest histogram, with NaN limits and 0 counts.
+        """
+        parts = self._read(tag, 'histogram', start, stop)
+        if not parts:
+            return np.zeros(0, dtype=histogram_dtype(0))
+        width = max(part.dtype['bucket_limits'].shape[0] for part in parts)
+        out = np.zeros(sum(len(part) for part in parts), dtype=histogram_dtype(width))
+        out['bucket_limits'] = np.nan
+        offset = 0
+        for part in parts:
+            n, w = len(part), part.dtype['bucket_limits'].shape[0]
+            for field, _ in HISTOGRAM_FIELDS:
+                out[field][offset:offset + n] = part[field]
+            out['bucket_limits'][offset:offset + n, :w] = part['bucket_limits']
+            out['bucket_counts'][offset:offset + n, :w] = part['bucket_counts']
+            offset += n
+        return out
+
+def export_tensorboard(log_dir, out_dir=None):
+    """ Write a ColumnarWriter store out as a tensorboard event file (in log_dir by default) """
+    from tensorboardX import SummaryWriter
+    reader = MetricsReader(log_dir)
+    with SummaryWriter(out_dir or log_dir) as writer:
+        def step(value):
+            return None if value < 0 else int(value)
+        for tag in reader.tags('scalar'):
+            for row in reader.scalars(tag):
+                writer.add_scalar(tag, row['value'], step(row['step']), walltime=row['wall_time'])
+        for tag in reader.tags('histogram'):
+            for row in reader.histograms(tag):
+                used = ~np.isnan(row['bucket_limits'])
+                writer.add_histogram_raw(tag, row['min'], row['max'], row['num'],
+                                         row['sum'], row['sum_squares'],
+                                         row['bucket_limits'][used].tolist(),
+                                         row['bucket_counts'][used].tolist(),
+                                         global_step=step(row['step']),
+                                         walltime=row['wall_time'])
+        for text in reader.texts():
+            writer.add_text(text['tag'], text['text'], step(text['step']),
+                            walltime=text['wall_time'])
@@ -12,7 +12,6 @@ setup(
   classifiers = [],
   license='MIT',
   install_requires = [
-    'sh',
     'tensorboardX',
     'tensorflow==1.6'
   ],
@@ -0,0 +1,110 @@
+import json
+import os
+import socket
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+WORLD_SIZE = 2
+
+pytestmark = pytest.mark.skipif(not (dist.is_available() and dist.is_gloo_available()),
+                                reason='needs torch.distributed with gloo')
+
+class RecordingWriter(object):
+    def __init__(self):
+        self.histograms = dict()
+        self.scalars = dict()
+
+    def add_histogram_raw(self, tag, global_step=None, **kwargs):
+        self.histograms['{}@{}'.format(tag, global_step)] = kwargs
+
+    def add_scalar(self, tag, value, global_step=None):
+        self.scalars['{}@{}'.format(tag, global_step)] = value
+
+    def add_text(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class Net(torch.nn.Module):
+    def __init__(self):
+        super(Net, self).__init__()
+        self.fc = torch.nn.Linear(4, 1)
+
+    def forward(self, x):
+        self.monitor('x', x)
+        return self.fc(x)
+
+def run_rank(rank, port, out_dir):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=WORLD_SIZE)
+    from pytorch_monitor import init_experiment, monitor_module
+
+    # every rank is seeded, not only the one that writes
+    writer, config = init_experiment({'log_dir':os.path.join(out_dir, 'runs'),
+                                      'distributed':True,
+                                      'random_seed':3,
+                                      'commit_run':False,
+                                      'background_git':False})
+    seeded = torch.rand(3).tolist()
+    writer.close()
+
+    # rank 0 holds 0..3 and rank 1 holds 10..13
+    recorder = RecordingWriter()
+    model = Net()
+    writer = monitor_module(model, recorder, track_stats=True, distributed=True)
+    for _ in range(2):
+        model(torch.arange(4.).view(1, 4) + 10 * rank).sum().backward()
+    model.flush_monitoring()
+    writer.close()
+
+    with open(os.path.join(out_dir, '{}.json'.format(rank)), 'w') as f:
+        json.dump({'seeded':seeded,
+                   'histograms':recorder.histograms,
+                   'scalars':recorder.scalars,
+                   'reductions':writer.reductions}, f)
+    dist.destroy_process_group()
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def test_merged_across_ranks(tmp_path):
+    mp.spawn(run_rank, args=(free_port(), str(tmp_path)), nprocs=WORLD_SIZE, join=True)
+    results = []
+    for rank in range(WORLD_SIZE):
+        with open(os.path.join(str(tmp_path), '{}.json'.format(rank))) as f:
+            results.append(json.load(f))
+    writer, other = results
+
+    # a single writer
+    assert writer['histograms'] and writer['scalars']
+    assert not other['histograms'] and not other['scalars']
+
+    # merged histograms count, bound and bin the values of all ranks
+    for step in range(2):
+        x = writer['histograms']['x/data@{}'.format(step)]
+        assert x['num'] == 8
+        assert x['min'] == 0. and x['max'] == 13.
+        assert x['sum'] == sum(range(4)) + sum(range(10, 14))
+        assert sum(x['bucket_counts']) == 8
+        # even before the range adapts, no bucket reaches outside the values
+        assert 0. <= min(x['bucket_limits']) and max(x['bucket_limits']) == 13.
+    # stats are those of the values of all ranks together, not averages of each rank's
+    values = torch.cat([torch.arange(4.), torch.arange(10., 14.)]).double()
+    assert writer['scalars']['x/data-mean@0'] == pytest.approx(values.mean().item())
+    assert writer['scalars']['x/data-std@0'] == pytest.approx(values.std().item())
+    assert writer['scalars']['x/data-norm@0'] == pytest.approx(values.norm().item())
+    assert writer['scalars']['x/data-sparsity@0'] == pytest.approx(1 / 8)
+    # one reduction per step (plus the one at close)
+    assert writer['reductions'] == other['reductions'] <= 3
+
+    assert writer['seeded'] == other['seeded']
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import torch
+from tensorboardX.summary import make_histogram
+
+from pytorch_monitor.histogram import histogram_raw, summarize, to_host
+
+TENSORS = {
+    'normal':lambda: torch.randn(1000),
+    'uniform-2d':lambda: torch.rand(7, 3),
+    'constant':lambda: torch.ones(5),
+    'integer':lambda: torch.arange(10),
+    'double-3d':lambda: torch.randn(3, 4, 5).double(),
+}
+
+@pytest.mark.parametrize('name', sorted(TENSORS))
+def test_matches_add_histogram(name):
+    """ histogram_raw(summarize(...)) gives what SummaryWriter.add_histogram would log """
+    torch.manual_seed(0)
+    tensor = TENSORS[name]()
+    row, = to_host(summarize([tensor], 51))
+    got = histogram_raw(row)
+    ref = make_histogram(tensor.numpy().astype(float), 51)
+    assert got['min'] == ref.min
+    assert got['max'] == ref.max
+    assert got['num'] == ref.num
+    assert np.isclose(got['sum'], ref.sum)
+    assert np.isclose(got['sum_squares'], ref.sum_squares)
+    assert np.allclose(got['bucket_limits'], ref.bucket_limit)
+    assert got['bucket_counts'] == list(ref.bucket)
+
+def test_batch_matches_single():
+    torch.manual_seed(0)
+    tensors = [torch.randn(100), torch.empty(0), torch.rand(4, 4)]
+    rows = to_host(summarize(tensors, 11))
+    assert rows[1] is None
+    for tensor, row in zip(tensors, rows):
+        if row is not None:
+            single, = to_host(summarize([tensor], 11))
+            assert np.array_equal(row, single)
@@ -0,0 +1,76 @@
+import pytest
+import torch
+
+from pytorch_monitor import monitor_module
+from pytorch_monitor.schedule import (always, every, log_spaced, make_schedule, never,
+                                      warmup)
+
+def steps(schedule, n=20):
+    return [step for step in range(n) if schedule(step)]
+
+def test_schedules():
+    assert steps(always, 3) == [0, 1, 2]
+    assert steps(never) == []
+    assert steps(every(5)) == [0, 5, 10, 15]
+    assert steps(every(5, start=3)) == [3, 8, 13, 18]
+    assert steps(log_spaced(), 70) == [0, 1, 2, 4, 8, 16, 32, 64]
+    assert steps(log_spaced(3.), 30) == [0, 1, 3, 9, 27]
+    assert steps(warmup(3, 5)) == [0, 1, 2, 3, 8, 13, 18]
+    with pytest.raises(ValueError):
+        every(0)
+    with pytest.raises(ValueError):
+        log_spaced(1.)
+
+def test_make_schedule():
+    schedule = make_schedule({'grad':3, 'stats':never, 'default':2})
+    assert steps(schedule['grad']) == steps(every(3))
+    assert steps(schedule['stats']) == []
+    assert steps(schedule['data']) == steps(schedule['vars']) == steps(every(2))
+    assert steps(make_schedule({'update':2})['data']) == steps(always)
+    assert steps(make_schedule(4)['update']) == steps(every(4))
+    with pytest.raises(ValueError):
+        make_schedule({'gradient':3})
+    with pytest.raises(TypeError):
+        make_schedule('often')
+
+class RecordingWriter(object):
+    def __init__(self):
+        self.histograms = dict()
+
+    def add_histogram_raw(self, tag, global_step=None, **kwargs):
+        self.histograms[(tag, global_step)] = kwargs
+
+    def add_scalar(self, tag, value, global_step=None):
+        pass
+
+def test_monitor_module_follows_schedule():
+    torch.manual_seed(0)
+    model = torch.nn.Linear(3, 2)
+    writer = RecordingWriter()
+    monitor_module(model, writer, schedule={'update':2, 'grad':3})
+
+    weights = []
+    for _ in range(8):
+        weights.append(model.weight.detach().clone())
+        model(torch.randn(4, 3)).pow(2).sum().backward()
+        with torch.no_grad():
+            for p in model.parameters():
+                p -= 0.1 * p.grad
+                p.grad = None
+    model.flush_monitoring()
+
+    def logged(tag):
+        return sorted(step for t, step in writer.histograms if t == tag)
+    assert logged('weight/data') == list(range(8))
+    assert logged('weight/grad') == [0, 3, 6]
+    # the update of step t is logged by the forward pass of step t + 1
+    assert logged('weight/update-val') == [0, 2, 4, 6]
+    assert logged('weight/update-ratio') == []
+
+    for step in logged('weight/update-val'):
+        update = weights[step + 1] - weights[step]
+        logged_update = writer.histograms[('weight/update-val', step)]
+        assert logged_update['num'] == update.numel()
+        assert logged_update['sum'] == pytest.approx(update.sum().item(), abs=1e-6)
+        assert logged_update['min'] == pytest.approx(update.min().item(), abs=1e-6)
+        assert logged_update['max'] == pytest.approx(update.max().item(), abs=1e-6)
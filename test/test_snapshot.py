@@ -0,0 +1,102 @@
+import pytest
+import torch
+
+from pytorch_monitor.snapshot import (CloneTracker, FlatTracker, SampledTracker, UpdateTracker,
+                                      make_update_tracker)
+
+def params():
+    torch.manual_seed(0)
+    return {'weight':torch.randn(30, 40), 'bias':torch.randn(40)}
+
+def step(ps):
+    return {name:p + 0.1 * torch.randn_like(p) for name, p in ps.items()}
+
+@pytest.mark.parametrize('spec', ['clone', 'flat'])
+def test_update_round_trip(spec):
+    tracker = make_update_tracker(spec)
+    before = params()
+    for name, p in before.items():
+        tracker.save(name, p)
+    after = step(before)
+    for name, p in after.items():
+        assert name in tracker
+        update, previous = tracker.update(name, p)
+        assert torch.equal(previous, before[name])
+        assert torch.allclose(update, p - before[name])
+
+def test_sampled_round_trip():
+    tracker = SampledTracker(k=100)
+    before = params()
+    for name, p in before.items():
+        tracker.save(name, p)
+    after = step(before)
+    # the weight is sampled, the bias fits in k and is tracked whole
+    idx = tracker.indices['weight']
+    assert idx.numel() == 100 and idx.unique().numel() == 100
+    assert 'bias' not in tracker.indices
+    update, previous = tracker.update('weight', after['weight'])
+    assert torch.allclose(update, (after['weight'] - before['weight']).reshape(-1)[idx])
+    update, previous = tracker.update('bias', after['bias'])
+    assert torch.allclose(update, after['bias'] - before['bias'])
+
+@pytest.mark.parametrize('cls', [CloneTracker, FlatTracker])
+def test_half_precision_and_offload(cls):
+    tracker = cls(dtype=torch.float16, device='cpu')
+    before = params()
+    for name, p in before.items():
+        tracker.save(name, p)
+    assert tracker.previous('weight').dtype == torch.float16
+    assert tracker.previous('weight').device.type == 'cpu'
+    assert tracker.memory_footprint() == 2 * (30 * 40 + 40)
+    after = step(before)
+    update, previous = tracker.update('weight', after['weight'])
+    # the update comes back at the parameter's precision
+    assert update.dtype == torch.float32
+    assert torch.allclose(update, after['weight'] - before['weight'], atol=1e-2)
+
+@pytest.mark.parametrize('cls', [CloneTracker, FlatTracker, SampledTracker])
+def test_buffers_reused_after_pop_and_clear(cls):
+    tracker = cls()
+    ps = params()
+    for name, p in ps.items():
+        tracker.save(name, p)
+    ptr = tracker.previous('weight').data_ptr()
+    footprint = tracker.memory_footprint()
+
+    tracker.pop('weight')
+    assert 'weight' not in tracker and 'bias' in tracker
+    tracker.clear()
+    assert 'bias' not in tracker
+    assert tracker.memory_footprint() == footprint
+
+    ps = step(ps)
+    for name, p in ps.items():
+        tracker.save(name, p)
+    assert 'weight' in tracker
+    assert tracker.previous('weight').data_ptr() == ptr
+    assert tracker.memory_footprint() == footprint
+
+    tracker.release()
+    assert 'weight' not in tracker
+    assert tracker.memory_footprint() < footprint
+
+def test_memory_footprint():
+    ps = params()
+    sizes = {'clone':4 * (30 * 40 + 40), 'flat':4 * (30 * 40 + 40),
+             # 100 sampled weights and their int64 indices, plus the whole bias
+             'sampled':4 * (100 + 40) + 8 * 100}
+    for spec, expected in sizes.items():
+        tracker = make_update_tracker(spec) if spec != 'sampled' else SampledTracker(k=100)
+        assert tracker.memory_footprint() == 0
+        for name, p in ps.items():
+            tracker.save(name, p)
+        assert tracker.memory_footprint() == expected
+
+def test_make_update_tracker():
+    assert isinstance(make_update_tracker(None), CloneTracker)
+    tracker = FlatTracker()
+    assert make_update_tracker(tracker) is tracker
+    with pytest.raises(ValueError):
+        make_update_tracker('nope')
+    with pytest.raises(TypeError):
+        UpdateTracker()
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+import torch
+
+from pytorch_monitor.store import ColumnarWriter, MetricsReader, export_tensorboard
+
+def write_steps(log_dir, steps, chunk_size=4):
+    with ColumnarWriter(log_dir, chunk_size=chunk_size) as writer:
+        for step in steps:
+            writer.add_scalar('loss', step * 0.5, step)
+            writer.add_histogram('w', torch.arange(step + 1.), step, bins=5)
+        writer.add_text('config', 'run {}'.format(steps[0]), steps[0])
+
+def test_step_range_across_chunks(tmp_path):
+    log_dir = str(tmp_path)
+    write_steps(log_dir, range(10))
+    reader = MetricsReader(log_dir)
+    assert reader.tags() == ['loss', 'w']
+    assert reader.tags('scalar') == ['loss']
+    assert len(reader.index['tags']['loss']['chunks']) == 3
+
+    scalars = reader.scalars('loss', 3, 9)
+    assert scalars['step'].tolist() == list(range(3, 9))
+    assert scalars['value'].tolist() == [step * 0.5 for step in range(3, 9)]
+    assert reader.scalars('loss')['step'].tolist() == list(range(10))
+    assert len(reader.scalars('loss', 20)) == 0
+
+    histograms = reader.histograms('w', 2, 6)
+    assert histograms['step'].tolist() == [2, 3, 4, 5]
+    assert histograms['num'].tolist() == [3., 4., 5., 6.]
+    assert histograms['max'].tolist() == [2., 3., 4., 5.]
+    counts = histograms['bucket_counts'].sum(axis=1)
+    assert counts.tolist() == histograms['num'].tolist()
+
+    with pytest.raises(KeyError):
+        reader.scalars('w')
+
+def test_flush_makes_rows_readable(tmp_path):
+    writer = ColumnarWriter(str(tmp_path), chunk_size=100)
+    writer.add_scalar('loss', 1., 0)
+    writer.flush()
+    writer.add_scalar('loss', 2., 1)
+    writer.flush()
+    assert MetricsReader(str(tmp_path)).scalars('loss')['value'].tolist() == [1., 2.]
+    writer.close()
+
+def test_reopen_appends(tmp_path):
+    log_dir = str(tmp_path)
+    write_steps(log_dir, range(6))
+    with ColumnarWriter(log_dir, chunk_size=4) as writer:
+        writer.add_scalar('loss', 3., 6)
+        writer.add_scalar('accuracy', .9, 6)
+    reader = MetricsReader(log_dir)
+    assert reader.tags('scalar') == ['accuracy', 'loss']
+    assert reader.scalars('loss')['step'].tolist() == list(range(7))
+    assert reader.scalars('accuracy')['value'].tolist() == [.9]
+    assert reader.histograms('w')['step'].tolist() == list(range(6))
+    assert len(reader.texts()) == 1
+
+def test_export_tensorboard(tmp_path):
+    log_dir, out_dir = str(tmp_path / 'store'), str(tmp_path / 'events')
+    write_steps(log_dir, range(5))
+    export_tensorboard(log_dir, out_dir)
+    events = os.listdir(out_dir)
+    assert len(events) == 1 and events[0].startswith('events.out.tfevents')
+
+    from tensorboardX.proto import event_pb2
+    steps = {'loss':[], 'w':[]}
+    for event in read_events(os.path.join(out_dir, events[0]), event_pb2):
+        for value in event.summary.value:
+            if value.tag in steps:
+                steps[value.tag].append(event.step)
+    assert steps == {'loss':list(range(5)), 'w':list(range(5))}
+
+def read_events(path, event_pb2):
+    """ Parse a TFRecord event file without tensorflow """
+    import struct
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(12)
+            if len(header) < 12:
+                return
+            length, = struct.unpack('Q', header[:8])
+            data = f.read(length)
+            f.read(4)
+            event = event_pb2.Event()
+            event.ParseFromString(data)
+            yield event